@@ -24,11 +24,13 @@ from gi.repository import GLib, GObject, Gio
 
 import sys, bisect, types, shlex, re, os, traceback
 
-from . import module, method, result, exceptions, metamodule
+from . import module, method, result, exceptions, metamodule, completion
 
 from commands.accel_group import AccelGroup
 from commands.accel_group import Accelerator
 
+import commands.manifest as manifest
+
 __all__ = ['is_commander_module', 'Commands', 'Accelerator']
 
 import commander.modules
@@ -131,6 +133,7 @@ class Commands(Singleton):
 
     def __init_once__(self):
         self._modules = None
+        self._trie = None
         self._dirs = []
         self._monitors = []
         self._accel_group = None
@@ -148,6 +151,9 @@ class Commands(Singleton):
 
         self._monitors = []
         self._modules = None
+        self._trie = None
+
+        manifest.save_cache()
 
         for k in self._timeouts:
             GLib.source_remove(self._timeouts[k])
@@ -186,6 +192,10 @@ class Commands(Singleton):
         self.ensure()
         return list(self._modules)
 
+    def command_trie(self):
+        self.ensure()
+        return self._trie
+
     def add_monitor(self, d):
         gfile = Gio.file_new_for_path(d)
         monitor = None
@@ -236,6 +246,7 @@ class Commands(Singleton):
         # Create new 'empty' module
         mod = module.Module(base, os.path.dirname(filename))
         bisect.insort_right(self._modules, mod)
+        self._trie.add(mod)
 
         # Reload the module
         self.reload_module(mod)
@@ -247,10 +258,15 @@ class Commands(Singleton):
             return
 
         self._modules = []
+        self._trie = completion.CommandTrie()
+
+        manifest.load_cache(os.path.join(GLib.get_user_cache_dir(), 'gedit', 'commander', 'manifests'))
 
         for d in self._dirs:
             self.scan(d)
 
+        manifest.save_cache()
+
     def _run_generator(self, state, ret=None):
         mod = sys.modules['commander.commands.result']
 
@@ -382,6 +398,7 @@ class Commands(Singleton):
         for r in mod.roots():
             if r in self._modules:
                 self._modules.remove(r)
+                self._trie.remove(r)
 
         # Remove accelerators
         if self._accel_group:
@@ -400,22 +417,26 @@ class Commands(Singleton):
         # Remove roots
         self.remove_module(mod)
 
-        # Now, try to reload the module
+        # Now, try to reload the module. Modules are only imported when first
+        # used, unless their commands cannot be read from the source
         try:
-            mod.reload()
+            if not mod.scan_manifest():
+                mod.reload()
         except Exception as e:
             # Reload failed, we remove the module
             info = traceback.format_tb(sys.exc_info()[2])
             print('Failed to reload module ({0}):\n  {1}'.format(mod.name, info[-1]))
 
             self._modules.remove(mod)
+            self._trie.remove(mod)
             return
 
         # Insert roots
         for r in mod.roots():
             bisect.insort(self._modules, r)
+            self._trie.add(r)
 
-        commander.modules.__dict__[mod.name] = metamodule.MetaModule(mod.mod)
+        commander.modules.__dict__[mod.name] = metamodule.MetaModule(mod)
 
         if self._accel_group:
             self.scan_accelerators([mod])
@@ -428,6 +449,7 @@ class Commands(Singleton):
         mod.unload()
         self.remove_module(mod)
         self._modules.remove(mod)
+        self._trie.remove(mod)
 
         return False
 
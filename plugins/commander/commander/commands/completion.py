@@ -21,6 +21,7 @@
 
 import commander.commands as commands
 import bisect
+import weakref
 import sys
 import os
 import re
@@ -43,47 +44,119 @@ def common_prefix(args, sep=None):
     # first: some-thing
     # second: sho-tar
     # res: s-t
-    args = list(args)
+    args = [str(x) for x in args]
 
     if not args:
         return ''
 
-    if len(args) == 1:
-        return str(args[0])
+    if not sep:
+        return os.path.commonprefix(args)
 
-    first = str(args[0])
-    second = str(args[1])
+    ret = args[0].split(sep)
 
-    if not sep:
-        ret = _common_prefix_part(first, second)
-    else:
-        first = first.split(sep)
-        second = second.split(sep)
-        ret = []
+    for arg in args[1:]:
+        ret = [_common_prefix_part(first, second)
+               for first, second in zip(ret, arg.split(sep))]
+
+    return sep.join(ret)
+
+class _TrieNode:
+    __slots__ = ('children', 'commands')
+
+    def __init__(self):
+        self.children = {}
+
+        # All the commands below this node, sorted by name
+        self.commands = []
+
+class CommandTrie:
+    """A trie of the names of the commands at one level of the dotted
+    command path. Every node keeps the sorted commands below it, so the
+    commands matching a prefix are found without scanning all of them."""
+
+    def __init__(self, cmds=()):
+        self._root = _TrieNode()
+
+        for cmd in cmds:
+            self.add(cmd)
+
+    def add(self, cmd):
+        node = self._root
+        bisect.insort(node.commands, cmd)
+
+        for c in cmd.name:
+            child = node.children.get(c)
+
+            if child is None:
+                child = _TrieNode()
+                node.children[c] = child
+
+            node = child
+
+            bisect.insort(node.commands, cmd)
+
+    def remove(self, cmd):
+        nodes = [self._root]
+
+        for c in cmd.name:
+            node = nodes[-1].children.get(c)
+
+            if node is None:
+                break
+
+            nodes.append(node)
+
+        for node in nodes:
+            node.commands = [x for x in node.commands if x is not cmd]
+
+        # Prune the nodes without commands
+        for i in range(len(nodes) - 1, 0, -1):
+            if not nodes[i].commands:
+                del nodes[i - 1].children[cmd.name[i - 1]]
 
-        for i in range(0, min(len(first), len(second))):
-            ret.append(_common_prefix_part(first[i], second[i]))
+    def prefixed(self, prefix):
+        node = self._root
 
-        ret = sep.join(ret)
+        for c in prefix:
+            node = node.children.get(c)
 
-    del args[0]
-    args[0] = ret
+            if node is None:
+                return []
 
-    return common_prefix(args, sep)
+        return node.commands
+
+    def match(self, subs):
+        # Only the commands starting with the first part can match
+        cmds = self.prefixed(subs[0])
+
+        if len(subs) == 1:
+            return list(cmds)
+
+        return [x for x in cmds if _filter_command(x, subs)]
+
+# The tries of the subcommands of each command
+_child_tries = weakref.WeakKeyDictionary()
+
+def _command_trie(cmd):
+    cmds = cmd.commands()
 
-def _expand_commands(cmds):
     if not cmds:
-        cmds.extend(commands.Commands().modules())
-        return
+        return None
+
+    # The trie is kept until the module rescans
+    # its commands, which makes a new list
+    try:
+        trie, cached = _child_tries[cmd]
 
-    old = list(cmds)
-    del cmds[:]
+        if cached is cmds:
+            return trie
+    except KeyError:
+        pass
 
-    # Expand 'commands' to all the respective subcommands
+    trie = CommandTrie(cmds)
+    _child_tries[cmd] = (trie, cmds)
 
-    for cmd in old:
-        for c in cmd.commands():
-            bisect.insort(cmds, c)
+    return trie
 
 def _filter_command(cmd, subs):
     parts = cmd.name.split('-')
@@ -97,22 +170,6 @@ def _filter_command(cmd, subs):
 
     return True
 
-def _filter_commands(cmds, subs):
-    # See what parts of cmds still match the parts in subs
-    idx = bisect.bisect_left(cmds, subs[0])
-    ret = []
-
-    while idx < len(cmds):
-        if not cmds[idx].name.startswith(subs[0]):
-            break
-
-        if _filter_command(cmds[idx], subs):
-            ret.append(cmds[idx])
-
-        idx += 1
-
-    return ret
-
 def single_command(words, idx):
     ret = command(words, idx)
 
@@ -130,24 +187,25 @@ def command(words, idx):
     s = words[idx].strip()
 
     parts = s.split('.')
-    cmds = []
+    tries = [commands.Commands().command_trie()]
 
-    for i in parts:
-        # Expand all the parents to their child commands
-        _expand_commands(cmds)
+    for i in range(0, len(parts)):
+        if i > 0:
+            # Expand all the parents to their child commands
+            tries = [x for x in map(_command_trie, cmds) if x]
 
-        if not cmds:
-            return None
+        subs = parts[i].split('-')
+        cmds = []
+
+        for trie in tries:
+            cmds.extend(trie.match(subs))
 
-        subs = i.split('-')
-        cmds = _filter_commands(cmds, subs)
+        if len(tries) > 1:
+            cmds.sort()
 
         if not cmds:
             return None
 
-    if not cmds:
-        return None
-
     if len(parts) == 1:
         completed = common_prefix(cmds)
     else:
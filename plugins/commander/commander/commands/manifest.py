@@ -0,0 +1,431 @@
+# -*- coding: utf-8 -*-
+#
+#  manifest.py - commander
+#
+#  Copyright (C) 2026 - agent <agent@local>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor,
+#  Boston, MA 02110-1301, USA.
+
+# Describes the commands of a commander module by reading its source, so that
+# the module only has to be imported when one of its commands is used. When
+# the source does something that cannot be followed without running it, no
+# manifest is made and the module is imported like before. Names imported
+# from other (non commander) modules are assumed not to be commands.
+#
+# Parsing takes longer than importing the compiled module, so like the compiled
+# modules the manifests are cached, until one of the files they were read from
+# changes.
+
+import ast
+import os
+import pickle
+
+__all__ = ['Function', 'Manifest', 'scan', 'load_cache', 'save_cache']
+
+# Bumped when the manifests change
+CACHE_VERSION = 1
+
+class Unsupported(Exception):
+    pass
+
+class Function:
+    def __init__(self, doc=None, accelerator=None):
+        self.doc = doc
+
+        # The (args, kwargs) of the accelerator decorator
+        self.accelerator = accelerator
+
+class Manifest:
+    def __init__(self, filename, bindings):
+        self.filename = filename
+
+        self.default = _known(bindings, '__default__')
+
+        if not isinstance(self.default, Function):
+            self.default = None
+
+        root = bindings.get('__root__', [])
+
+        if root is _UNKNOWN:
+            raise Unsupported()
+
+        # The roots are only the functions, like Module.roots
+        self.roots = {}
+
+        for name in root:
+            item = _known(bindings, name)
+
+            if isinstance(item, Function):
+                self.roots[name] = item
+
+        self.commands = {}
+
+        for name in bindings:
+            if name.startswith('_') or name in root:
+                continue
+
+            item = _known(bindings, name)
+
+            if isinstance(item, (Function, Manifest)):
+                self.commands[name] = item
+
+        # Only kept for the aliases of the functions of submodules
+        self.bindings = {}
+
+        for name in bindings:
+            if isinstance(bindings[name], (Function, Manifest)):
+                self.bindings[name] = bindings[name]
+
+# A name bound to something which is not a command
+_OTHER = object()
+
+# A name bound to something the source does not tell
+_UNKNOWN = object()
+
+def _known(bindings, name):
+    item = bindings.get(name)
+
+    if item is _UNKNOWN:
+        raise Unsupported()
+
+    return item
+
+def _module_filename(dirname, name):
+    path = os.path.join(dirname, name)
+
+    if os.path.isdir(path):
+        path = os.path.join(path, '__init__.py')
+    else:
+        path += '.py'
+
+    if not os.path.isfile(path):
+        return None
+
+    return path
+
+def _decorator_name(node):
+    if isinstance(node, ast.Name):
+        return node.id
+    elif isinstance(node, ast.Attribute):
+        return node.attr
+    else:
+        return None
+
+def _function(node):
+    accelerator = None
+
+    for decorator in node.decorator_list:
+        # Only commands.autocomplete and commands.accelerator are known
+        # to return the function itself
+        if not isinstance(decorator, ast.Call):
+            raise Unsupported()
+
+        name = _decorator_name(decorator.func)
+
+        if name == 'accelerator':
+            try:
+                args = tuple(ast.literal_eval(x) for x in decorator.args)
+                kwargs = dict((x.arg, ast.literal_eval(x.value)) for x in decorator.keywords)
+            except ValueError:
+                raise Unsupported()
+
+            if None in kwargs:
+                raise Unsupported()
+
+            accelerator = (args, kwargs)
+        elif name != 'autocomplete':
+            raise Unsupported()
+
+    return Function(ast.get_docstring(node, clean=False), accelerator)
+
+class _Scanner:
+    def __init__(self, filename, package, scanning, files):
+        self.filename = filename
+
+        # The directory of the package the module is in, if any
+        self.package = package
+        self.scanning = scanning
+
+        # All the files read, for the cache
+        self.files = files
+
+        self.bindings = {}
+
+    def value(self, node):
+        if isinstance(node, ast.Name):
+            return self.bindings.get(node.id, _OTHER)
+        elif isinstance(node, ast.Lambda):
+            return Function()
+        elif isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name):
+            # An alias of a function of a commander submodule
+            mod = self.bindings.get(node.value.id)
+
+            if isinstance(mod, Manifest):
+                return mod.bindings.get(node.attr, _UNKNOWN)
+        elif isinstance(node, (ast.Constant, ast.JoinedStr, ast.List, ast.Tuple,
+                               ast.Set, ast.Dict, ast.ListComp, ast.SetComp,
+                               ast.DictComp, ast.GeneratorExp, ast.BinOp,
+                               ast.UnaryOp, ast.BoolOp, ast.Compare)):
+            return _OTHER
+
+        return _UNKNOWN
+
+    def target_name(self, target):
+        if isinstance(target, ast.Name):
+            return target.id
+
+        # locals()['name'] = ... at the module level
+        if isinstance(target, ast.Subscript) and \
+           isinstance(target.value, ast.Call) and \
+           isinstance(target.value.func, ast.Name) and \
+           target.value.func.id in ('locals', 'globals') and \
+           isinstance(target.slice, ast.Constant) and \
+           isinstance(target.slice.value, str):
+            return target.slice.value
+
+        return None
+
+    def assign(self, target, value):
+        if isinstance(target, (ast.Tuple, ast.List)):
+            for elt in target.elts:
+                self.assign(elt, _UNKNOWN)
+
+            return
+
+        if isinstance(target, ast.Starred):
+            self.assign(target.value, _UNKNOWN)
+            return
+
+        name = self.target_name(target)
+
+        if name != None:
+            self.bindings[name] = value
+
+    def import_from(self, node):
+        if node.level == 0:
+            for alias in node.names:
+                if alias.name == '*':
+                    raise Unsupported()
+
+                self.bindings[alias.asname or alias.name] = _OTHER
+
+            return
+
+        # Only 'from . import submodule' can be followed
+        if node.level != 1 or node.module or not self.package:
+            raise Unsupported()
+
+        for alias in node.names:
+            filename = _module_filename(self.package, alias.name)
+
+            if not filename or filename in self.scanning:
+                raise Unsupported()
+
+            mod = _scan(filename, self.package, self.scanning | set([filename]), self.files)
+
+            if mod is None:
+                mod = _OTHER
+
+            self.bindings[alias.asname or alias.name] = mod
+
+    def bind_unknown(self, node):
+        # Everything bound at the module level inside a compound
+        # statement depends on how the statement runs
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            self.bindings[node.name] = _UNKNOWN
+            return
+
+        if isinstance(node, ast.ImportFrom) and any(x.name == '*' for x in node.names):
+            raise Unsupported()
+
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                self.bindings[alias.asname or alias.name.split('.')[0]] = _UNKNOWN
+        elif isinstance(node, ast.Assign):
+            for target in node.targets:
+                self.assign(target, _UNKNOWN)
+        elif isinstance(node, (ast.AugAssign, ast.AnnAssign, ast.NamedExpr)):
+            self.assign(node.target, _UNKNOWN)
+        elif isinstance(node, (ast.For, ast.AsyncFor)):
+            self.assign(node.target, _UNKNOWN)
+        elif isinstance(node, ast.withitem) and node.optional_vars:
+            self.assign(node.optional_vars, _UNKNOWN)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            self.bindings[node.name] = _UNKNOWN
+        elif isinstance(node, ast.Delete):
+            for target in node.targets:
+                self.assign(target, _UNKNOWN)
+
+        if isinstance(node, ast.Lambda):
+            return
+
+        for child in ast.iter_child_nodes(node):
+            self.bind_unknown(child)
+
+    def statement(self, node):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            self.bindings[node.name] = _function(node)
+        elif isinstance(node, ast.ClassDef):
+            self.bindings[node.name] = _OTHER
+        elif isinstance(node, ast.Import):
+            for alias in node.names:
+                self.bindings[alias.asname or alias.name.split('.')[0]] = _OTHER
+        elif isinstance(node, ast.ImportFrom):
+            self.import_from(node)
+        elif isinstance(node, ast.Assign):
+            if len(node.targets) == 1 and self.target_name(node.targets[0]) == '__root__':
+                try:
+                    self.bindings['__root__'] = list(ast.literal_eval(node.value))
+                except ValueError:
+                    self.bindings['__root__'] = _UNKNOWN
+
+                return
+
+            value = self.value(node.value)
+
+            for target in node.targets:
+                self.assign(target, value)
+        elif isinstance(node, ast.AnnAssign):
+            if node.value:
+                self.assign(node.target, self.value(node.value))
+        elif isinstance(node, ast.AugAssign):
+            self.assign(node.target, _UNKNOWN)
+        elif isinstance(node, ast.Delete):
+            for target in node.targets:
+                name = self.target_name(target)
+
+                if name != None:
+                    self.bindings.pop(name, None)
+        elif not isinstance(node, ast.Expr):
+            self.bind_unknown(node)
+
+    def scan(self, tree):
+        marked = False
+
+        for node in tree.body:
+            if isinstance(node, ast.Assign) and \
+               any(self.target_name(x) == '__commander_module__' for x in node.targets):
+                marked = True
+
+        if not marked:
+            # Modules which are not commander modules do not need to be
+            # followed, unless they could still become one
+            for node in ast.walk(tree):
+                if isinstance(node, ast.Name) and node.id == '__commander_module__':
+                    raise Unsupported()
+
+            return None
+
+        for node in tree.body:
+            self.statement(node)
+
+        if not '__commander_module__' in self.bindings:
+            return None
+
+        return Manifest(self.filename, self.bindings)
+
+def _scan(filename, package, scanning, files):
+    files.append(filename)
+
+    try:
+        with open(filename, 'rb') as f:
+            tree = ast.parse(f.read(), filename)
+    except (OSError, SyntaxError, ValueError):
+        raise Unsupported()
+
+    # Relative imports are relative to the package the module is in
+    if os.path.basename(filename) == '__init__.py':
+        package = os.path.dirname(filename)
+
+    return _Scanner(filename, package, scanning, files).scan(tree)
+
+_cache = {}
+_cache_file = None
+_cache_dirty = False
+
+def _stamp(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+
+    return (st.st_mtime_ns, st.st_size)
+
+def load_cache(filename):
+    global _cache, _cache_file, _cache_dirty
+
+    _cache = {}
+    _cache_file = filename
+    _cache_dirty = False
+
+    try:
+        with open(filename, 'rb') as f:
+            data = pickle.load(f)
+
+        if data['version'] == CACHE_VERSION:
+            _cache = data['manifests']
+    except Exception:
+        # Missing, or written by another version
+        pass
+
+def save_cache():
+    global _cache_dirty
+
+    if not _cache_dirty or not _cache_file:
+        return
+
+    try:
+        os.makedirs(os.path.dirname(_cache_file), exist_ok=True)
+
+        tmp = _cache_file + '.tmp'
+
+        with open(tmp, 'wb') as f:
+            pickle.dump({'version': CACHE_VERSION, 'manifests': _cache}, f)
+
+        os.replace(tmp, _cache_file)
+        _cache_dirty = False
+    except OSError:
+        pass
+
+def scan(dirname, name):
+    """Returns the Manifest of the commander module 'name' in dirname,
+    or None when the module has to be imported to know its commands."""
+    global _cache_dirty
+
+    filename = _module_filename(dirname, name)
+
+    if not filename:
+        return None
+
+    if filename in _cache:
+        stamps, ret = _cache[filename]
+
+        if all(_stamp(f) == stamp for f, stamp in stamps):
+            return ret
+
+    files = []
+
+    try:
+        ret = _scan(filename, None, set([filename]), files)
+    except Unsupported:
+        ret = None
+
+    _cache[filename] = ([(f, _stamp(f)) for f in files], ret)
+    _cache_dirty = True
+
+    return ret
+
+# ex:ts=4:et
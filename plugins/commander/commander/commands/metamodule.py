@@ -19,35 +19,47 @@
 #  Foundation, Inc., 51 Franklin Street, Fifth Floor,
 #  Boston, MA 02110-1301, USA.
 
+import types
+
+def _module(meta):
+    mod = object.__getattribute__(meta, '_mod')
+
+    # Commander modules are imported when first used
+    if type(mod) != types.ModuleType:
+        mod.load()
+        mod = mod.mod
+
+    return mod
+
 class MetaModule(object):
     def __init__(self, mod):
         object.__setattr__(self, '_mod', mod)
 
     def __getattribute__(self, name):
-        return getattr(object.__getattribute__(self, "_mod"), name)
+        return getattr(_module(self), name)
 
     def __delattr__(self, name):
-        delattr(object.__getattribute__(self, "_mod"), name)
+        delattr(_module(self), name)
 
     def __setattr__(self, name, value):
-        setattr(object.__getattribute__(self, "_mod"), name, value)
+        setattr(_module(self), name, value)
 
     def __getitem__(self, item):
-        return object.__getattribute__(self, "_mod")[item]
+        return _module(self)[item]
 
     def __setitem__(self, item, value):
-        object.__getattribute__(self, "_mod")[item] = value
+        _module(self)[item] = value
 
     def __delitem__(self, item):
-        del object.__getattribute__(self, "_mod")[item]
+        del _module(self)[item]
 
     def __iter__(self):
-        return iter(object.__getattribute__(self, "_mod"))
+        return iter(_module(self))
 
     def __contains__(self, item):
-        return item in object.__getattribute__(self, "_mod")
+        return item in _module(self)
 
     def __call__(self, *args, **kw):
-        object.__getattribute__(self, "_mod").__default__(*args, **kw)
+        _module(self).__default__(*args, **kw)
 
 # vi:ts=4:et
@@ -24,8 +24,48 @@ import sys, os, types, bisect, importlib
 import utils
 import commands.exceptions as exceptions
 import commands.method as method
+import commands.manifest as manifest
 import commands.rollbackimporter as rollbackimporter
 
+from commands.accel_group import Accelerator
+
+def _accelerator(function):
+    if function and function.accelerator:
+        return Accelerator(*function.accelerator)
+    else:
+        return None
+
+class ManifestMethod(method.Method):
+    # A function of a module which has not been imported yet. Everything but
+    # its name, documentation and accelerator comes from the real function,
+    # which imports the module.
+    def __init__(self, function, name, parent):
+        method.Method.__init__(self, self._call, name, parent)
+
+        self._doc = function.doc
+        self._accelerator = _accelerator(function)
+
+    def resolve(self):
+        return self.parent.resolve_command(self.real_name)
+
+    def _call(self, *args, **kwargs):
+        return self.resolve().method(*args, **kwargs)
+
+    def doc(self):
+        return self._doc or ''
+
+    def accelerator(self):
+        return self._accelerator
+
+    def autocomplete_func(self):
+        return self.resolve().autocomplete_func()
+
+    def func_props(self):
+        return self.resolve().func_props()
+
+    def execute(self, argstr, words, entry, modifier, kk = {}):
+        return self.resolve().execute(argstr, words, entry, modifier, kk)
+
 class Module(method.Method):
     def __init__(self, base, mod, parent=None):
         method.Method.__init__(self, None, base, parent)
@@ -33,6 +73,7 @@ class Module(method.Method):
         self._commands = None
         self._dirname = None
         self._roots = None
+        self._manifest = None
 
         if type(mod) == types.ModuleType:
             self.mod = mod
@@ -41,6 +82,10 @@ class Module(method.Method):
                 self.method = mod.__dict__['__default__']
             else:
                 self.method = None
+        elif isinstance(mod, manifest.Manifest):
+            # A submodule of a module which has not been imported yet
+            self.mod = None
+            self.set_manifest(mod)
         else:
             self.mod = None
             self._dirname = mod
@@ -48,15 +93,104 @@ class Module(method.Method):
 
     def commands(self):
         if self._commands == None:
-            self.scan_commands()
+            if self.is_lazy():
+                self.scan_manifest_commands()
+            else:
+                self.scan_commands()
 
         return self._commands
 
+    def is_lazy(self):
+        return self.mod == None and self._manifest != None
+
+    def set_manifest(self, mod):
+        self._manifest = mod
+        self._func_props = None
+
+        # Keeps the accelerator registered before importing
+        self._accelerator = _accelerator(mod.default)
+
+        if mod.default:
+            self.method = self._call_default
+        else:
+            self.method = None
+
+    def _call_default(self, *args, **kwargs):
+        self.load()
+        return self.method(*args, **kwargs)
+
+    def load(self):
+        # Import the module of which only the manifest was read
+        if not self.is_lazy():
+            return
+
+        if self._dirname:
+            self._import()
+        else:
+            real = self.parent.resolve_command(self.real_name)
+
+            if not isinstance(real, Module):
+                raise exceptions.Execute('Could not find command: ' + self.name)
+
+            self.mod = real.mod
+            self.method = real.method
+            self._func_props = None
+
+        self._commands = None
+
+    def resolve_command(self, name):
+        self.load()
+
+        if self.mod == None or not name in self.mod.__dict__:
+            raise exceptions.Execute('Could not find command: ' + name)
+
+        item = self.mod.__dict__[name]
+
+        if type(item) == types.FunctionType:
+            return method.Method(item, name, self)
+        elif type(item) == types.ModuleType and utils.is_commander_module(item):
+            return Module(name, item, self)
+        else:
+            raise exceptions.Execute('Could not find command: ' + name)
+
+    def doc(self):
+        if not self.is_lazy():
+            return method.Method.doc(self)
+        elif self._manifest.default and self._manifest.default.doc:
+            return self._manifest.default.doc
+        else:
+            return ''
+
+    def accelerator(self):
+        if self._manifest == None:
+            return method.Method.accelerator(self)
+        else:
+            return self._accelerator
+
+    def autocomplete_func(self):
+        self.load()
+        return method.Method.autocomplete_func(self)
+
+    def func_props(self):
+        self.load()
+        return method.Method.func_props(self)
+
+    def execute(self, argstr, words, entry, modifier, kk = {}):
+        self.load()
+        return method.Method.execute(self, argstr, words, entry, modifier, kk)
+
     def clear(self):
         self._commands = None
 
     def roots(self):
         if self._roots == None:
+            if self._manifest != None:
+                # The roots stay the same when the module is imported
+                roots = self._manifest.roots
+                self._roots = list(map(lambda x: ManifestMethod(roots[x], x, self), roots))
+
+                return self._roots
+
             if not self.mod:
                 return []
 
@@ -99,7 +233,36 @@ class Module(method.Method):
 
                 # Insert root functions into this module
                 for r in mod.roots():
-                    bisect.insert(self._commands, r)
+                    bisect.insort(self._commands, r)
+
+    def scan_manifest_commands(self):
+        self._commands = []
+        cmds = self._manifest.commands
+
+        for k in cmds:
+            if isinstance(cmds[k], manifest.Manifest):
+                mod = Module(k, cmds[k], self)
+                bisect.insort(self._commands, mod)
+
+                for r in mod.roots():
+                    bisect.insort(self._commands, r)
+            else:
+                bisect.insort(self._commands, ManifestMethod(cmds[k], k, self))
+
+    def scan_manifest(self):
+        # Read the commands from the source instead of importing the module,
+        # returns False if the module has to be imported to know them
+        if not self.unload():
+            return False
+
+        self._roots = None
+        self._manifest = manifest.scan(self._dirname, self.real_name)
+
+        if self._manifest == None:
+            return False
+
+        self.set_manifest(self._manifest)
+        return True
 
     def unload(self):
         self._commands = None
@@ -116,6 +279,12 @@ class Module(method.Method):
         if not self.unload():
             return
 
+        self._roots = None
+        self._manifest = None
+
+        self._import()
+
+    def _import(self):
         if self.real_name in sys.modules:
             raise Exception('Module already exists...')
 
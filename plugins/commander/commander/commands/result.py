@@ -48,12 +48,15 @@ HIDE = Result(Result.HIDE)
 DONE = Result(Result.DONE)
 
 class Prompt(Result):
-    def __init__(self, prompt, autocomplete={}):
+    def __init__(self, prompt, autocomplete={}, changed=None):
         Result.__init__(self, Result.PROMPT)
 
         self.prompt = prompt
         self.autocomplete = autocomplete
 
+        # Called with the text of the entry each time it changes
+        self.changed = changed
+
 class Suspend(Result):
     def __init__(self):
         Result.__init__(self, Result.SUSPEND)
@@ -60,6 +60,7 @@ class Entry(Gtk.Box):
         self._history_prefix = None
 
         self._prompt_text = None
+        self._prompt_changed = None
         self._accel_group = None
 
         self._wait_timeout = 0
@@ -161,6 +162,7 @@ GtkEntry#gedit-commander-entry {
         self._entry.set_margin_end(3)
 
         self._entry.connect('key-press-event', self._on_entry_key_press)
+        self._entry.connect('changed', self._on_entry_changed)
 
         self._entry.show()
         hbox.add(self._entry)
@@ -330,6 +332,7 @@ GtkEntry#gedit-commander-entry {
                 self._entry.set_text('')
             elif self._command_state:
                 self._command_state.clear()
+                self._prompt_changed = None
                 self._prompt()
             else:
                 self._view.grab_focus()
@@ -371,6 +374,10 @@ GtkEntry#gedit-commander-entry {
         self._history_prefix = None
         return False
 
+    def _on_entry_changed(self, widget):
+        if not self._prompt_changed is None and not self._accel_group:
+            self._prompt_changed(self._entry.get_text())
+
     def _on_history_move(self, direction, modifier):
         pos = self._entry.get_position()
 
@@ -438,6 +445,10 @@ GtkEntry#gedit-commander-entry {
         self._make_info()
         self._info.status(text)
 
+    def info_trim(self, max_lines):
+        if not self._info is None:
+            self._info.trim(max_lines)
+
     def _info_add_action(self, stock, callback, data=None):
         self._make_info()
         return self._info.add_action(stock, callback, data)
@@ -481,6 +492,7 @@ GtkEntry#gedit-commander-entry {
 
     def _run_command(self, cb):
         self._suspended = None
+        self._prompt_changed = None
 
         try:
             ret = cb()
@@ -515,6 +527,7 @@ GtkEntry#gedit-commander-entry {
 
             if ret == mod.Result.PROMPT:
                 self._prompt(ret.prompt)
+                self._prompt_changed = ret.changed
             elif (ret == None or ret == mod.HIDE) and not self._prompt_text and (self._info is None or self._info.is_empty):
                 self._command_state.clear()
                 self._view.grab_focus()
@@ -257,6 +257,14 @@ class Info(Gtk.Box):
     def clear(self):
         self.text_view.get_buffer().set_text('')
 
+    def trim(self, max_lines):
+        # Removes the first lines, keeping at most max_lines
+        buf = self.text_view.get_buffer()
+        n = buf.get_line_count() - max_lines
+
+        if n > 0:
+            buf.delete(buf.get_start_iter(), buf.get_iter_at_line(n))
+
     def _ensure_button_bar(self):
         if not self._button_bar:
             self._button_bar = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=3)
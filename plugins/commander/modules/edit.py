@@ -31,6 +31,7 @@ import commander.commands as commands
 import commander.commands.completion
 import commander.commands.result
 import commander.commands.exceptions
+import commander.commands.module
 
 __commander_module__ = True
 
@@ -174,6 +175,14 @@ def command(view, name):
     """Edit commander command: edit.command &lt;command&gt;"""
     parts = name.split('.')
 
+    # Commander modules are only imported when first used
+    for cmd in commands.Commands().modules():
+        if cmd.real_name == parts[0] or cmd.name == parts[0]:
+            if isinstance(cmd, commander.commands.module.Module):
+                cmd.load()
+            elif isinstance(cmd.parent, commander.commands.module.Module):
+                cmd.parent.load()
+
     for mod in sys.modules:
         if commands.is_commander_module(sys.modules[mod]) and (mod == parts[0] or _mod_has_alias(sys.modules[mod], parts[0])):
             if mod == parts[0]:
@@ -48,6 +48,17 @@ class TextFinder(finder.Finder):
         else:
             return False
 
+    def find_all(self, bounds):
+        text = bounds[0].get_slice(bounds[1])
+
+        if self.flags & Gedit.SearchFlags.CASE_SENSITIVE:
+            flags = 0
+        else:
+            flags = re.IGNORECASE
+
+        findre = re.compile(re.escape(self.get_find()), flags)
+        return [(m.start(), m.end(), self.replacestr) for m in findre.finditer(text)]
+
 def __default__(entry, argstr):
     """Find in document: find &lt;text&gt;
 
@@ -22,7 +22,107 @@
 from xml.sax import saxutils
 import commander.commands.result
 import commander.utils as utils
-from gi.repository import Gdk, Gtk
+from gi.repository import GLib, Gdk, Gtk
+import time
+
+class ReplaceAll:
+    # Applies all replacements of a snapshot of the search range in a single
+    # user action. They are applied from the last to the first, so that the
+    # offsets of the ones still to be applied stay valid, in idle slices of
+    # SLICE_TIME seconds so that the progress can be shown and cancelled.
+    SLICE_TIME = 0.02
+
+    def __init__(self, entry, offset, matches):
+        self.entry = entry
+        self.view = entry.view()
+        self.offset = offset
+        self.matches = matches
+
+        self.remaining = len(matches)
+        self.suspend = None
+        self.idle = 0
+        self.done = False
+
+        # The offsets are only valid as long as nothing else edits the buffer
+        self.view.set_editable(False)
+        self.view.get_buffer().begin_user_action()
+
+    def run(self):
+        # Returns a Suspend to wait for if not everything could be replaced
+        # in the first slice
+        if self.replace_slice():
+            return None
+
+        self.suspend = commander.commands.result.Suspend()
+        self.suspend.register(self.on_resume)
+
+        self.idle = GLib.idle_add(self.on_idle)
+        return self.suspend
+
+    def replace_slice(self):
+        buf = self.view.get_buffer()
+        deadline = time.monotonic() + ReplaceAll.SLICE_TIME
+
+        while self.remaining > 0:
+            self.remaining -= 1
+            start, end, repl = self.matches[self.remaining]
+
+            startiter = buf.get_iter_at_offset(self.offset + start)
+            enditer = buf.get_iter_at_offset(self.offset + end)
+
+            buf.delete(startiter, enditer)
+            buf.insert(startiter, repl)
+
+            if self.remaining % 64 == 0 and time.monotonic() > deadline:
+                break
+
+        if self.remaining == 0:
+            self.finish()
+            return True
+
+        total = len(self.matches)
+        self.entry.info_status('<i>Replacing\u2026 %d of %d</i>' % (total - self.remaining, total))
+
+        return False
+
+    def on_resume(self):
+        # Cancelled from the entry, which already resumes the suspend
+        if not self.done:
+            self.suspend = None
+            self.stop()
+
+    def on_idle(self):
+        if self.replace_slice():
+            self.idle = 0
+            return False
+
+        return True
+
+    def finish(self):
+        self.done = True
+
+        self.view.get_buffer().end_user_action()
+        self.view.set_editable(True)
+
+        if self.suspend:
+            self.entry.info_status(None)
+
+            sus = self.suspend
+            self.suspend = None
+            sus.resume()
+
+    def stop(self):
+        if self.done:
+            return
+
+        if self.idle:
+            GLib.source_remove(self.idle)
+            self.idle = 0
+
+        total = len(self.matches)
+        self.entry.info_show('<i>Replace all cancelled after %d of %d replacements</i>' % (total - self.remaining, total), True)
+
+        self.finish()
 
 class Finder:
     FIND_STARTMARK = 'gedit-commander-find-startmark'
@@ -59,6 +159,12 @@ class Finder:
     def do_find(self, bounds):
         return None
 
+    def find_all(self, bounds):
+        # Returns a list of (start, end, replacement) of all matches within
+        # bounds, with offsets relative to the start of bounds, or None when
+        # the matches can only be found one by one
+        return None
+
     def get_replace(self, text):
         return self.replacestr
 
@@ -240,6 +346,20 @@ class Finder:
         else:
             return self.replacestr
 
+    def _replace_all(self):
+        buf = self.view.get_buffer()
+
+        # The end of the search boundaries is moved when wrapping around
+        start = buf.get_iter_at_mark(self.search_boundaries.start)
+        end = buf.get_iter_at_mark(buf.get_mark(Finder.FIND_ENDMARK))
+
+        matches = self.find_all([start, end])
+
+        if matches == None:
+            return None
+
+        return ReplaceAll(self.entry, start.get_offset(), matches)
+
     def replace(self, findstr, replaceall=False, replacestr=None):
         if findstr:
             self.set_find(findstr)
@@ -276,6 +396,30 @@ class Finder:
                 self.cancel()
                 raise e
 
+        if replaceall:
+            job = self._replace_all()
+
+            if job != None:
+                try:
+                    suspend = job.run()
+
+                    if suspend:
+                        yield suspend
+                except GeneratorExit as e:
+                    job.stop()
+                    self._restore_cursor(startmark)
+                    self.cancel()
+                    raise e
+
+                # Cancelled or simply done
+                job.stop()
+
+                if self.scroll_back:
+                    self._restore_cursor(startmark)
+
+                self.cancel()
+                yield commander.commands.result.DONE
+
         # On replace all, wrap it in begin/end user action
         if replaceall:
             buf.begin_user_action()
@@ -23,6 +23,7 @@ import commander.commands as commands
 from . import finder
 
 import re
+import bisect
 
 __commander_module__ = True
 __root__ = ['regex_i']
@@ -34,6 +35,20 @@ class RegexFinder(finder.Finder):
         self.flags = re.UNICODE | re.MULTILINE | flags
         self.groupre = re.compile('(\\\\)?\\$([0-9]+|{(([0-9]+):([^}]+))})')
 
+        # A snapshot of the whole buffer, kept until it changes, and the
+        # matches in it found so far. The matches depend on where the search
+        # ends, for instance for '$', which only changes when wrapping around
+        self._text = None
+        self._changed_id = 0
+        self._clear_matches()
+
+    def _clear_matches(self):
+        self._matches = []
+        self._starts = []
+        self._match_iter = None
+        self._match_end = None
+        self._all_matched = False
+
     def set_find(self, findstr):
         finder.Finder.set_find(self, findstr)
 
@@ -42,23 +57,75 @@ class RegexFinder(finder.Finder):
         except Exception as e:
             raise commands.exceptions.Execute('Invalid regular expression: ' + str(e))
 
+        self._clear_matches()
+
+    def _on_buffer_changed(self, buf):
+        self._text = None
+        self._clear_matches()
+
+    def _snapshot(self):
+        if self._text == None:
+            buf = self.view.get_buffer()
+            self._text = buf.get_start_iter().get_slice(buf.get_end_iter())
+
+            if not self._changed_id:
+                self._changed_id = buf.connect('changed', self._on_buffer_changed)
+
+        return self._text
+
+    def _search(self, start, end):
+        text = self._snapshot()
+
+        if self._match_end != end:
+            self._clear_matches()
+            self._match_end = end
+
+        if self._match_iter == None and not self._all_matched:
+            self._match_iter = self.findre.finditer(text, 0, end)
+
+        # Find the matches up to the start, they are found only once
+        while not self._all_matched and (not self._matches or self._matches[-1].end() <= start):
+            m = next(self._match_iter, None)
+
+            if m == None:
+                self._match_iter = None
+                self._all_matched = True
+            else:
+                self._matches.append(m)
+                self._starts.append(m.start())
+
+        i = bisect.bisect_left(self._starts, start)
+
+        # A search from inside a match could give a different match
+        if i > 0 and self._matches[i - 1].end() > start:
+            return self.findre.search(text, start, end)
+
+        if i == len(self._matches):
+            return None
+
+        return self._matches[i]
+
     def do_find(self, bounds):
         buf = self.view.get_buffer()
 
-        text = bounds[0].get_text(bounds[1])
-        ret = self.findre.search(text)
+        ret = self._search(bounds[0].get_offset(), bounds[1].get_offset())
 
         if ret:
-            start = bounds[0].copy()
-            start.forward_chars(ret.start())
-
-            end = bounds[0].copy()
-            end.forward_chars(ret.end())
-
-            return [start, end]
+            return [buf.get_iter_at_offset(ret.start()),
+                    buf.get_iter_at_offset(ret.end())]
         else:
             return False
 
+    def cancel(self):
+        if self._changed_id:
+            self.view.get_buffer().disconnect(self._changed_id)
+            self._changed_id = 0
+
+        self._text = None
+        self._clear_matches()
+
+        finder.Finder.cancel(self)
+
     def _transform(self, text, trans):
         if not trans:
             return text
@@ -93,6 +160,46 @@ class RegexFinder(finder.Finder):
     def _do_re_replace(self, matchit):
         return self.groupre.sub(lambda x: self._do_re_replace_group(matchit, x), self.replacestr)
 
+    def _replace_parts(self):
+        # The replacement string split in literal text and group references,
+        # so that it only has to be parsed once for all matches
+        parts = []
+        last = 0
+
+        for group in self.groupre.finditer(self.replacestr):
+            parts.append(self.replacestr[last:group.start()])
+            parts.append(group)
+
+            last = group.end()
+
+        parts.append(self.replacestr[last:])
+        return parts
+
+    def replace_match(self, matchit, parts):
+        ret = []
+
+        for part in parts:
+            if isinstance(part, str):
+                ret.append(part)
+            else:
+                ret.append(self._do_re_replace_group(matchit, part))
+
+        return ''.join(ret)
+
+    def find_all(self, bounds):
+        # Searched in the snapshot like do_find, so that anchors and
+        # lookarounds see the text around the bounds
+        text = self._snapshot()
+        start = bounds[0].get_offset()
+        parts = self._replace_parts()
+
+        try:
+            return [(m.start() - start, m.end() - start, self.replace_match(m, parts))
+                    for m in self.findre.finditer(text, start, bounds[1].get_offset())
+                    if m.end() > m.start()]
+        except Exception as e:
+            raise commands.exceptions.Execute('Invalid replacement: ' + str(e))
+
     def get_replace(self, text):
         try:
             return self.findre.sub(self._do_re_replace, text)
@@ -138,6 +245,9 @@ class SemanticFinder(RegexFinder):
 
         return ret
 
+    def replace_match(self, matchit, parts):
+        return self.get_replace(matchit.group(0))
+
     def get_replace(self, text):
         m = self.findre.match(text)
         groups = m.groups()
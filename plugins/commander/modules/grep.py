@@ -24,7 +24,11 @@ import commander.commands.completion
 import commander.commands.result
 import commander.commands.exceptions
 
+from gi.repository import GLib
+
+from xml.sax import saxutils
 import re
+import time
 
 __commander_module__ = True
 HideTagName = 'CommanderModuleGrepHideTag'
@@ -94,87 +98,505 @@ def _grep_action_zoomout(view, start, end):
 
     buf.apply_tag(tag, start, end)
 
-def _highlight(view, start, end, matches):
-    buf = view.get_buffer()
-    tag = _get_highlight_tag(buf)
+class _Grep:
+    # Matches each line on its own, but only the lines a single search over a
+    # snapshot of the document finds a match in, and applies the actions to
+    # the runs of consecutive (non) matching lines instead of to each line.
+    # Done in idle slices of SLICE_TIME seconds.
+    #
+    # A snapshot can be passed in as text, and when only the lines starting
+    # at the offsets in starts can match, only those lines are matched. With
+    # record, the offsets of the matching lines are kept in self.matched.
+    SLICE_TIME = 0.02
+
+    def __init__(self, entry, view, reg, match_action, non_match_action, text=None, starts=None, record=False):
+        self.entry = entry
+        self.view = view
+        self.reg = reg
+        self.match_action = match_action
+        self.non_match_action = non_match_action
+
+        buf = view.get_buffer()
+        self.highlight_tag = _get_highlight_tag(buf)
+
+        if text is None:
+            text = buf.get_start_iter().get_slice(buf.get_end_iter())
+
+        self.text = text
+        self.n_lines = self.text.count('\n') + 1
+
+        if starts is not None:
+            self.lines = self.lines_at(starts)
+        elif _searchable(reg.pattern):
+            self.lines = self.lines_searched(re.compile(reg.pattern, reg.flags | re.MULTILINE))
+        else:
+            self.lines = self.lines_at_all()
+
+        if record:
+            self.matched = []
+        else:
+            self.matched = None
 
-    for match in matches:
-        st = start.copy()
-        ed = start.copy()
+        # The line at offset self.pos, and the number of lines done
+        self.line = 0
+        self.pos = 0
+        self.classified = 0
 
-        st.forward_chars(match.start(0))
-        ed.forward_chars(match.end(0))
+        # The pending run of lines, and highlight
+        self.run = None
+        self.highlight = None
 
-        buf.apply_tag(tag, st, ed)
+        self.suspend = None
+        self.idle = 0
+        self.done = False
+        self.complete = False
 
-def _unhighlight(view, start, end, matches):
-    buf = view.get_buffer()
-    tag = _get_highlight_tag(buf)
+        # The snapshot is no longer valid when the document changes
+        self.changed_id = buf.connect('changed', self.on_changed)
 
-    for match in matches:
-        st = start.copy()
-        ed = start.copy()
+    def run_slices(self):
+        # Returns a Suspend to wait for if the first slice did not finish
+        if self.do_slice():
+            return None
 
-        st.forward_chars(match.start(0))
-        ed.forward_chars(match.end(0))
+        self.suspend = commander.commands.result.Suspend()
+        self.suspend.register(self.on_resume)
 
-        buf.remove_tag(tag, st, ed)
+        self.idle = GLib.idle_add(self.on_idle)
+        return self.suspend
 
-def _grep(view, regex, match_action, non_match_action):
-    buf = view.get_buffer()
-    start = buf.get_start_iter()
+    def on_idle(self):
+        if self.do_slice():
+            self.idle = 0
+            return False
+
+        return True
+
+    def on_resume(self):
+        # Cancelled from the entry, which already resumes the suspend
+        if not self.done:
+            self.suspend = None
+            self.stop()
+
+    def on_changed(self, buf):
+        self.stop('<i>Document changed, grep stopped</i>')
+
+    def match_line(self, start):
+        # Returns the matches of the line starting at start, matched like a
+        # string of its own, and the start of the next line (or -1)
+        text = self.text
+        end = text.find('\n', start)
+
+        if end == -1:
+            end = len(text)
+            next_start = -1
+        else:
+            end += 1
+            next_start = end
+
+        spans = [(start + m.start(), start + m.end()) for m in self.reg.finditer(text[start:end])]
+        return spans, next_start
+
+    def lines_at(self, starts):
+        for start in starts:
+            line = self.line_at(start)
+            spans, next_start = self.match_line(start)
+
+            if spans:
+                yield line, spans
+
+    def lines_at_all(self):
+        start = 0
+
+        while start != -1:
+            line = self.line_at(start)
+            spans, start = self.match_line(start)
+
+            if spans:
+                yield line, spans
+
+    def lines_searched(self, search):
+        # A line matching on its own is found by the search as well, or is
+        # part of a match found over several lines. All of those lines are
+        # then matched, and the search continues after them.
+        text = self.text
+        pos = 0
+
+        while True:
+            m = search.search(text, pos)
+
+            if m is None:
+                return
+
+            line = self.line_at(m.start())
+            last = line + text.count('\n', m.start(), max(m.start(), m.end() - 1))
+            start = self.pos
+
+            while True:
+                spans, next_start = self.match_line(start)
+
+                if spans:
+                    yield line, spans
+
+                if next_start == -1:
+                    return
+
+                if line == last:
+                    break
+
+                start = next_start
+                line = self.line_at(start)
+
+            pos = next_start
+
+    def line_at(self, offset):
+        # The offsets only increase, so counting the lines is linear overall
+        n = self.text.count('\n', self.pos, offset)
+
+        if n:
+            self.line += n
+            self.pos = self.text.rindex('\n', self.pos, offset) + 1
+
+        return self.line
+
+    def iter_at_line(self, line):
+        buf = self.view.get_buffer()
+
+        if line >= self.n_lines:
+            return buf.get_end_iter()
+        else:
+            return buf.get_iter_at_line(line)
+
+    def add_lines(self, start, end, matching):
+        if start >= end:
+            return
+
+        if self.run and self.run[1] == start and self.run[2] == matching:
+            self.run[1] = end
+            return
+
+        self.flush_run()
+        self.run = [start, end, matching]
+
+    def flush_run(self):
+        if not self.run:
+            return
+
+        start, end, matching = self.run
+        self.run = None
+
+        if matching:
+            action = self.match_action
+        else:
+            action = self.non_match_action
+
+        action(self.view, self.iter_at_line(start), self.iter_at_line(end))
+
+    def add_match(self, line, start, end):
+        # Lines without a match in between do not match
+        if line >= self.classified:
+            self.add_lines(self.classified, line, False)
+            self.add_lines(line, line + 1, True)
+
+            self.classified = line + 1
+
+            if not self.matched is None:
+                self.matched.append(self.text.rfind('\n', 0, start) + 1)
+
+        if start == end:
+            return
+
+        if self.highlight and self.highlight[1] >= start:
+            self.highlight[1] = max(self.highlight[1], end)
+        else:
+            self.flush_highlight()
+            self.highlight = [start, end]
+
+    def flush_highlight(self):
+        if not self.highlight:
+            return
+
+        buf = self.view.get_buffer()
+        start, end = self.highlight
+        self.highlight = None
+
+        buf.apply_tag(self.highlight_tag, buf.get_iter_at_offset(start), buf.get_iter_at_offset(end))
+
+    def do_slice(self):
+        deadline = time.monotonic() + _Grep.SLICE_TIME
+        n = 0
+
+        for line, spans in self.lines:
+            for start, end in spans:
+                self.add_match(line, start, end)
+
+            n += 1
+
+            if n % 64 == 0 and time.monotonic() > deadline:
+                self.entry.info_status('<i>Searching\u2026 line %d of %d</i>' % (self.line + 1, self.n_lines))
+                return False
+
+        self.add_lines(self.classified, self.n_lines, False)
+
+        self.complete = True
+        self.finish()
+
+        return True
 
+    def finish(self):
+        self.done = True
+
+        self.flush_run()
+        self.flush_highlight()
+
+        self.view.get_buffer().disconnect(self.changed_id)
+
+        if self.suspend:
+            self.entry.info_status(None)
+
+            sus = self.suspend
+            self.suspend = None
+            sus.resume()
+
+    def stop(self, message='<i>Grep cancelled</i>'):
+        if self.done:
+            return
+
+        if self.idle:
+            GLib.source_remove(self.idle)
+            self.idle = 0
+
+        if message:
+            self.entry.info_show(message, True)
+
+        # Keep what was done, the rest of the document is left as it was
+        self.run = None
+        self.highlight = None
+
+        self.finish()
+
+def _compile(regex):
     try:
-        reg = re.compile(regex)
+        return re.compile(regex)
     except Exception as e:
         raise commands.exceptions.Execute('Invalid regular expression: ' + str(e))
 
-    while True:
-        end = start.copy()
+def _searchable(regex):
+    # Whether the search over the whole snapshot finds every line that matches
+    # on its own. Anything looking around a match, or at the end of the line
+    # string (which ends after its newline), could see the lines next to it.
+    return not any(x in regex for x in ('$', '\\A', '\\Z', '\\B', '(?=', '(?!', '(?<'))
+
+def _is_literal(regex):
+    return not any(c in '.^$*+?{}[]\\|()' for c in regex)
+
+def _narrows(regex, previous):
+    # Every line matching a literal also contains the literals it contains
+    return previous and _is_literal(previous) and _is_literal(regex) and previous in regex
+
+class _LiveGrep:
+    # Greps the document again each time the pattern changes. A pass is only
+    # started once no key was typed for DELAY milliseconds, and a pass still
+    # running for an older pattern is abandoned. A pattern narrowing the one
+    # of the last complete pass only has to be matched on the lines that one
+    # matched.
+    DELAY = 150
+
+    def __init__(self, entry, view, match_action, non_match_action):
+        self.entry = entry
+        self.view = view
+        self.match_action = match_action
+        self.non_match_action = non_match_action
+
+        self.pattern = None
+        self.job = None
+        self.timeout = 0
+        self.status = False
+
+        # The snapshot of the document, and the pattern and matching lines of
+        # the last complete pass over it
+        self.text = None
+        self.last = None
+
+        self.changed_id = view.get_buffer().connect('changed', self.on_changed)
+
+    def on_changed(self, buf):
+        self.text = None
+        self.last = None
+
+    def changed(self, text):
+        if self.timeout:
+            GLib.source_remove(self.timeout)
+
+        # Like the pattern the command gets when enter is pressed
+        self.timeout = GLib.timeout_add(_LiveGrep.DELAY, self.on_timeout, text.strip())
+
+    def on_timeout(self, text):
+        self.timeout = 0
+
+        try:
+            self.update(text)
+        except commands.exceptions.Execute as e:
+            self.entry.info_status('<i>%s</i>' % (saxutils.escape(str(e)),))
+            self.status = True
+
+        return False
+
+    def update(self, pattern):
+        if self.timeout:
+            GLib.source_remove(self.timeout)
+            self.timeout = 0
+
+        if pattern == self.pattern:
+            return
+
+        reg = _compile(pattern)
+
+        self.stop(None)
+        self.pattern = pattern
+
+        if self.status:
+            self.entry.info_status(None)
+            self.status = False
+
+        buf = self.view.get_buffer()
+        bounds = buf.get_bounds()
 
-        if not end.forward_line():
-            end.forward_to_line_end()
+        buf.remove_tag(_get_highlight_tag(buf), *bounds)
 
-        text = start.get_text(end)
-        piter = list(reg.finditer(text))
+        if not pattern:
+            self.match_action(self.view, *bounds)
+            return
 
-        if not piter:
-            _unhighlight(view, start, end, piter)
-            non_match_action(view, start, end)
+        starts = None
+
+        if self.last and _narrows(pattern, self.last[0]):
+            starts = self.last[1]
+
+        job = _Grep(self.entry, self.view, reg, self.match_action, self.non_match_action, self.text, starts, True)
+
+        self.text = job.text
+        self.job = job
+
+        suspend = job.run_slices()
+
+        if suspend:
+            suspend.register(self.on_done, job)
         else:
-            _highlight(view, start, end, piter)
-            match_action(view, start, end)
+            self.on_done(job)
+
+    def on_done(self, job):
+        if job is self.job:
+            self.job = None
+
+        if job.complete and job.text is self.text:
+            self.last = (job.reg.pattern, job.matched)
+
+    def wait(self):
+        if self.job:
+            return self.job.suspend
+        else:
+            return None
+
+    def stop(self, message='<i>Grep cancelled</i>'):
+        if self.job:
+            self.job.stop(message)
+
+    def clear(self):
+        # Shows all lines again, without highlights
+        self.stop()
+        self.pattern = None
+
+        buf = self.view.get_buffer()
+        bounds = buf.get_bounds()
+
+        buf.remove_tag(_get_highlight_tag(buf), *bounds)
+        self.match_action(self.view, *bounds)
+
+    def close(self):
+        if self.timeout:
+            GLib.source_remove(self.timeout)
+            self.timeout = 0
+
+        self.stop(None)
+        self.view.get_buffer().disconnect(self.changed_id)
 
-        if not start.forward_line():
-            break
+def _grep(entry, view, regex, match_action, non_match_action):
+    reg = _compile(regex)
 
-def __default__(view, argstr):
+    job = _Grep(entry, view, reg, match_action, non_match_action)
+    suspend = job.run_slices()
+
+    if suspend:
+        try:
+            yield suspend
+        except GeneratorExit as e:
+            job.stop()
+            raise e
+
+        # Cancelled or simply done
+        job.stop()
+
+        yield commander.commands.result.DONE
+
+def __default__(entry, view, argstr):
     """Hide non-matching lines in document: grep &lt;regex&gt;
 
 Matches a regular expression on each line and hides all text that does not
 match. For the revere (hiding matches) use grep.hide"""
-    yield _grep(view, argstr, _grep_action_show, _grep_action_hide)
+    return _grep(entry, view, argstr, _grep_action_show, _grep_action_hide)
 
-def hide(view, argstr):
+def hide(entry, view, argstr):
     """Hide matching lines in document: grep.hide &lt;regex&gt;
 
 Matches a regular expression on each line and hides all matches. For
 the reverse (hiding lines that do not match) use grep.show"""
-    yield _grep(view, argstr, _grep_action_hide, _grep_action_show)
+    return _grep(entry, view, argstr, _grep_action_hide, _grep_action_show)
 
-def zoomin(view, argstr):
+def zoomin(entry, view, argstr):
     """Zoom in on matching lines in document: grep.zoomin &lt;regex&gt;
 
 Matches a regular expression on each line and magnifies all matching lines
 with respect to the non-matching lines. For the reverse, use grep.zoomout"""
-    yield _grep(view, argstr, _grep_action_zoomin, _grep_action_zoomout)
+    return _grep(entry, view, argstr, _grep_action_zoomin, _grep_action_zoomout)
 
-def zoomout(view, argstr):
+def zoomout(entry, view, argstr):
     """Zoom out on matching lines in document: grep.zoomout &lt;regex&gt;
 
 Matches a regular expression on each line and minifies all matching lines
 with respect to the non-matching lines. For the reverse, use grep.zoomin"""
-    yield _grep(view, argstr, _grep_action_zoomout, _grep_action_zoomin)
+    return _grep(entry, view, argstr, _grep_action_zoomout, _grep_action_zoomin)
+
+def live(entry, view):
+    """Hide non-matching lines while typing: grep.live
+
+Prompts for a regular expression and hides all lines that do not match it,
+again each time it is changed. Press enter to keep the result, when
+cancelled all lines are shown again."""
+    grep = _LiveGrep(entry, view, _grep_action_show, _grep_action_hide)
+    keep = False
+
+    try:
+        regex, words, modifier = (yield commander.commands.result.Prompt('Grep:', changed=grep.changed))
+
+        grep.update(regex)
+
+        job = grep.job
+        suspend = grep.wait()
+
+        if suspend:
+            yield suspend
+
+        # Cancelled or simply done
+        keep = job is None or job.complete
+    finally:
+        if not keep:
+            grep.clear()
+
+        grep.close()
+
+    if suspend:
+        yield commander.commands.result.DONE
 
 def clear(view):
     """Clear all grep commands: grep.clear
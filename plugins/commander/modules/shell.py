@@ -24,6 +24,8 @@ import fcntl
 import os
 import tempfile
 import signal
+import codecs
+import collections
 from gi.repository import GLib, GObject, Gio
 
 import commander.commands as commands
@@ -34,12 +36,26 @@ __commander_module__ = True
 __root__ = ['!', '!!', '!&']
 
 class Process:
+    # The output is read CHUNK_SIZE bytes at a time. When replacing, it is
+    # kept in a temporary file (in memory up to MAX_SPOOL_SIZE) until the
+    # command is done. Otherwise only the last MAX_LINES lines are kept for
+    # the info, which is updated every UPDATE_INTERVAL milliseconds, and
+    # longer lines than MAX_LINE_LENGTH are split. This way the memory used
+    # does not grow with the output.
+    CHUNK_SIZE = 65536
+    MAX_LINES = 1000
+    MAX_LINE_LENGTH = 4096
+    MAX_SPOOL_SIZE = 1048576
+    UPDATE_INTERVAL = 100
+
     def __init__(self, entry, pipe, replace, background, tmpin, stdout, suspend):
         self.pipe = pipe
         self.replace = replace
         self.tmpin = tmpin
         self.entry = entry
         self.suspend = suspend
+        self.update_timeout = 0
+        self._output = None
 
         if replace:
             self.entry.view().set_editable(False)
@@ -50,52 +66,122 @@ class Process:
 
             channel = GLib.IOChannel.unix_new(stdout.fileno())
             self.watch = GLib.io_add_watch(channel, GLib.PRIORITY_DEFAULT, conditions, self.collect_output)
-            self._buffer = ''
+
+            # Characters can be split over two reads
+            self._decoder = codecs.getincrementaldecoder('utf-8')('replace')
+
+            # The last, unfinished, line and the lines not yet shown
+            self._line = ''
+            self._lines = collections.deque(maxlen=Process.MAX_LINES)
+
+            if replace:
+                self._output = tempfile.SpooledTemporaryFile(Process.MAX_SPOOL_SIZE, 'w+', encoding='utf-8', newline='')
         else:
             stdout.close()
 
+    def add_output(self, text):
+        if not text:
+            return
+
+        if self.replace:
+            self._output.write(text)
+            return
+
+        parts = (self._line + text).split("\n")
+        self._line = parts.pop()
+
+        if parts and max(map(len, parts)) > Process.MAX_LINE_LENGTH:
+            for p in parts:
+                self.add_line(p)
+        else:
+            self._lines.extend(parts)
+
+        while len(self._line) > Process.MAX_LINE_LENGTH:
+            self._lines.append(self._line[:Process.MAX_LINE_LENGTH])
+            self._line = self._line[Process.MAX_LINE_LENGTH:]
+
+        if self._lines and not self.update_timeout:
+            self.update_timeout = GLib.timeout_add(Process.UPDATE_INTERVAL, self.on_update_timeout)
+
+    def add_line(self, line):
+        for i in range(0, max(len(line), 1), Process.MAX_LINE_LENGTH):
+            self._lines.append(line[i:i + Process.MAX_LINE_LENGTH])
+
+    def finish_output(self):
+        self.add_output(self._decoder.decode(b'', True))
+
+        if self._line:
+            self._lines.append(self._line)
+            self._line = ''
+
+    def replace_selection(self):
+        # Only done once all of the output was read
+        buf = self.entry.view().get_buffer()
+        buf.begin_user_action()
+
+        bounds = buf.get_selection_bounds()
+
+        if bounds:
+            buf.delete(bounds[0], bounds[1])
+
+        mark = buf.create_mark(None, buf.get_iter_at_mark(buf.get_insert()), False)
+        self._output.seek(0)
+
+        while True:
+            text = self._output.read(Process.CHUNK_SIZE)
+
+            if not text:
+                break
+
+            buf.insert(buf.get_iter_at_mark(mark), text)
+
+        buf.delete_mark(mark)
+        buf.end_user_action()
+
+    def on_update_timeout(self):
+        self.update_timeout = 0
+        self.update()
+
+        return False
+
     def update(self):
-        parts = self._buffer.split("\n")
+        if not self._lines:
+            return
 
-        for p in parts[:-1]:
-            self.entry.info_show(p)
+        self.entry.info_show("\n".join(self._lines))
+        self.entry.info_trim(Process.MAX_LINES)
 
-        self._buffer = parts[-1]
+        self._lines.clear()
 
     def collect_output(self, fd, condition):
+        more = False
+
         if condition & (GLib.IOCondition.IN | GLib.IOCondition.PRI):
             try:
-                ret = fd.read()
+                ret = os.read(fd.unix_get_fd(), Process.CHUNK_SIZE)
 
                 # This seems to happen on OS X...
                 if len(ret) == 0:
                     condition = condition | GLib.IOCondition.HUP
                 else:
-                    self._buffer += ret.decode('utf-8')
-
-                    if not self.replace:
-                        self.update()
+                    self.add_output(self._decoder.decode(ret))
+                    more = True
+            except BlockingIOError:
+                pass
             except Exception as e:
-                if len(self._buffer) > 0:
-                    self.entry.info_show(self._buffer.strip("\n"))
-
+                self.finish_output()
                 self.stop()
                 return False
 
         if condition & (GLib.IOCondition.ERR | GLib.IOCondition.HUP):
-            if self.replace:
-                buf = self.entry.view().get_buffer()
-                buf.begin_user_action()
-
-                bounds = buf.get_selection_bounds()
+            # Read what is left first
+            if more:
+                return True
 
-                if bounds:
-                    buf.delete(bounds[0], bounds[1])
+            self.finish_output()
 
-                buf.insert_at_cursor(self._buffer)
-                buf.end_user_action()
-            elif len(self._buffer) > 0:
-                self.entry.info_show(self._buffer.strip("\n"))
+            if self.replace:
+                self.replace_selection()
 
             self.stop()
             return False
@@ -111,6 +197,16 @@ class Process:
 
         GLib.source_remove(self.watch)
 
+        if self.update_timeout:
+            GLib.source_remove(self.update_timeout)
+            self.update_timeout = 0
+
+        self.update()
+
+        if self._output:
+            self._output.close()
+            self._output = None
+
         if self.replace:
             self.entry.view().set_editable(True)
 
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+#
+#  testgrep.py - commander grep module tests
+#
+#  Copyright (C) 2026 - agent <agent@local>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor,
+#  Boston, MA 02110-1301, USA.
+
+import random
+import re
+import unittest
+
+import grep
+
+
+class Iter(object):
+    def __init__(self, buf, offset):
+        self.buf = buf
+        self.offset = offset
+
+    def get_slice(self, other):
+        return self.buf.text[self.offset:other.offset]
+
+
+class Buffer(object):
+    """Just what _Grep uses of a GtkTextBuffer, the actions
+       and the highlights are recorded per character.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.line_starts = [0] + [i + 1 for i, c in enumerate(text) if c == '\n']
+        self.highlighted = set()
+
+    def get_start_iter(self):
+        return Iter(self, 0)
+
+    def get_end_iter(self):
+        return Iter(self, len(self.text))
+
+    def get_iter_at_line(self, line):
+        return Iter(self, self.line_starts[line])
+
+    def get_iter_at_offset(self, offset):
+        return Iter(self, offset)
+
+    def connect(self, *args):
+        return 1
+
+    def disconnect(self, handler_id):
+        pass
+
+    def apply_tag(self, tag, start, end):
+        self.highlighted.update(range(start.offset, end.offset))
+
+
+class View(object):
+    def __init__(self, buf):
+        self.buf = buf
+        self.states = {}
+
+    def get_buffer(self):
+        return self.buf
+
+
+class Entry(object):
+    def info_status(self, text):
+        pass
+
+    def info_show(self, text, use_markup=False):
+        pass
+
+
+def _action(state):
+    def action(view, start, end):
+        for offset in range(start.offset, end.offset):
+            view.states[offset] = state
+
+    return action
+
+
+def _grep_per_line(text, pattern):
+    """How grep has always matched, each line as a string of its own."""
+    reg = re.compile(pattern)
+    buf = Buffer(text)
+    states = {}
+    highlighted = set()
+
+    for line, start in enumerate(buf.line_starts):
+        if line + 1 < len(buf.line_starts):
+            end = buf.line_starts[line + 1]
+        else:
+            end = len(text)
+
+        matches = list(reg.finditer(text[start:end]))
+
+        for offset in range(start, end):
+            states[offset] = matches and 'match' or 'other'
+
+        for m in matches:
+            highlighted.update(range(start + m.start(), start + m.end()))
+
+    return states, highlighted
+
+
+def _grep(text, pattern, **kwargs):
+    buf = Buffer(text)
+    view = View(buf)
+
+    job = grep._Grep(Entry(), view, re.compile(pattern),
+                     _action('match'), _action('other'), **kwargs)
+
+    while not job.do_slice():
+        pass
+
+    return view.states, buf.highlighted
+
+
+class TestGrep(unittest.TestCase):
+
+    def setUp(self):
+        self._get_highlight_tag = grep._get_highlight_tag
+        grep._get_highlight_tag = lambda buf: 'highlight'
+
+    def tearDown(self):
+        grep._get_highlight_tag = self._get_highlight_tag
+
+    def test_match_over_lines(self):
+        text = 'bb bb xa\nxb\na b ab\n \nb\n\n\n\n\nxbab aabbba xx\nx a xabbbb '
+        pattern = r'[ab]+\s+[ab]'
+
+        self.assertEqual(_grep_per_line(text, pattern), _grep(text, pattern))
+
+    def test_per_line(self):
+        patterns = [r'ab', r'^b', r'a$', r'a\nb', r'\s+', r'x*', r'b\n',
+                    r'[ab]+\n?a', r'(?<=a)b', r'(?<=\n)a', r'\Ab', r'a\Z',
+                    r'\n$', r'\bb', r'\n\B', r'a(?=\n)', r'a(?!b)',
+                    r'(?s)a.b', r'^', r'$', r'(a)\1', r'\W+']
+
+        rand = random.Random(5)
+
+        for pattern in patterns:
+            for i in range(200):
+                text = ''.join(rand.choice('ab\nx a')
+                               for j in range(rand.randrange(0, 60)))
+
+                self.assertEqual(_grep_per_line(text, pattern),
+                                 _grep(text, pattern),
+                                 '%r on %r' % (pattern, text))
+
+    def test_narrowed(self):
+        rand = random.Random(3)
+
+        for i in range(200):
+            text = '\n'.join(''.join(rand.choice('abc') for j in range(rand.randrange(0, 8)))
+                             for k in range(rand.randrange(1, 40)))
+
+            buf = Buffer(text)
+            view = View(buf)
+            job = grep._Grep(Entry(), view, re.compile('a'),
+                             _action('match'), _action('other'), record=True)
+
+            while not job.do_slice():
+                pass
+
+            self.assertEqual(_grep_per_line(text, 'ab'),
+                             _grep(text, 'ab', starts=job.matched))
+
+if __name__ == '__main__':
+    unittest.main()
+
+# ex:ts=4:et
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  Copyright (C) 2026 - agent <agent@local>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc.  51 Franklin Street, Fifth Floor, Boston, MA
+#  02110-1301 USA.
+
+"""Compares the gutter's diff engine with the old difflib based one.
+
+   Usage: benchdiff.py [--sizes 10000,100000,1000000] [--edits 0.001]
+"""
+
+import argparse
+import difflib
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'git'))
+
+import diff
+
+
+def make_lines(n_lines, rng):
+    words = ('foo', 'bar', 'baz', 'self', 'return', 'if', 'else', '{', '}',
+             '=', '+', 'x', 'y', 'value', 'None', '(', ')', ':')
+
+    lines = []
+    for i in range(n_lines):
+        # Real sources have plenty of duplicated lines
+        if rng.random() < 0.2:
+            lines.append(rng.choice(('', '}', '    }', '        return x')))
+
+        else:
+            lines.append(' '.join(rng.choice(words)
+                                  for j in range(rng.randint(1, 10))))
+
+    return lines
+
+
+def edit_lines(lines, density, rng):
+    lines = list(lines)
+
+    for i in range(max(1, int(len(lines) * density))):
+        pos = rng.randrange(len(lines))
+        kind = rng.random()
+
+        if kind < 0.4:
+            lines[pos] = lines[pos] + ' edited'
+
+        elif kind < 0.7:
+            lines.insert(pos, 'inserted %d' % (i))
+
+        else:
+            del lines[pos]
+
+    return lines
+
+
+def difflib_context(old_lines, new_lines):
+    """The unified diff round-trip that the gutter used to do."""
+    diff_iter = difflib.unified_diff(old_lines, new_lines, n=0)
+
+    try:
+        next(diff_iter)
+        next(diff_iter)
+
+    except StopIteration:
+        return {}
+
+    file_context = {}
+    for line_data in diff_iter:
+        if line_data[0] == '@':
+            for token in line_data.split():
+                if token[0] == '+':
+                    hunk_point = int(token.split(',', 1)[0])
+                    line_context = [None, []]
+                    break
+
+        elif line_data[0] == '-':
+            line_context[1].append(line_data[1:])
+            file_context[hunk_point] = line_context
+
+        elif line_data[0] == '+':
+            file_context[hunk_point] = line_context
+            hunk_point += 1
+
+    return file_context
+
+
+def engine_context(old_lines, new_lines):
+    file_context = {}
+
+    for old_start, old_end, new_start, new_end in \
+            diff.diff_lines(old_lines, new_lines):
+        line_context = [None, old_lines[old_start:old_end]]
+
+        if new_start == new_end:
+            file_context[max(new_start, 1)] = line_context
+
+        for line in range(new_start + 1, new_end + 1):
+            file_context[line] = line_context
+
+    return file_context
+
+
+def measure(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--edits', type=float, default=0.001,
+                        help='fraction of the lines that are edited')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-difflib-above', type=int, default=None,
+                        help='do not run difflib on larger files')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    print('%10s %12s %12s %9s' % ('lines', 'difflib (s)', 'engine (s)',
+                                  'speedup'))
+
+    for n_lines in (int(x) for x in args.sizes.split(',')):
+        old_lines = make_lines(n_lines, rng)
+        new_lines = edit_lines(old_lines, args.edits, rng)
+
+        engine = measure(engine_context, old_lines, new_lines)
+
+        if args.skip_difflib_above is not None and \
+                n_lines > args.skip_difflib_above:
+            print('%10d %12s %12.3f %9s' % (n_lines, '-', engine, '-'))
+            continue
+
+        legacy = measure(difflib_context, old_lines, new_lines)
+        print('%10d %12.3f %12.3f %8.1fx' % (n_lines, legacy, engine,
+                                            legacy / engine))
+
+
+if __name__ == '__main__':
+    main()
+
+# ex:ts=4:et:
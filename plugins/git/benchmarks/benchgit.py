@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#  Copyright (C) 2026 - agent <agent@local>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc.  51 Franklin Street, Fifth Floor, Boston, MA
+#  02110-1301 USA.
+
+"""Benchmarks the hot paths of the git plugin without a display.
+
+   A synthetic repository is built with the git command in a temporary
+   directory and the results are written as JSON, so that they can be
+   compared between revisions. Use run-benchmarks.sh to run it, the
+   Gedit typelib has to be found for the plugin to be imported.
+
+   Usage: benchgit.py [--files 10000] [--depth 6] [--output results.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import weakref
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+import gi
+gi.require_version('Gtk', '3.0')
+gi.require_version('GtkSource', '3.0')
+gi.require_version('Ggit', '1.0')
+
+from gi.repository import GLib, Gio, GtkSource, Ggit
+
+from git import diff
+from git.diffthread import GitDiffThread
+from git.repositoryindex import RepositoryIndex
+from git.statusservice import GitStatusThread, StatusCaches
+from git.workerthread import WorkerThread
+
+from benchdiff import make_lines, edit_lines
+
+
+BENCHMARKS = ('status', 'get_repository', 'diff', 'delivery')
+
+
+def summarize(samples):
+    """Returns the statistics of the samples, which are in seconds,
+       in milliseconds.
+    """
+    samples = sorted(samples)
+
+    return {
+        'count': len(samples),
+        'min': samples[0] * 1000,
+        'median': statistics.median(samples) * 1000,
+        'mean': statistics.mean(samples) * 1000,
+        'p95': samples[int(len(samples) * 0.95)] * 1000,
+        'max': samples[-1] * 1000
+    }
+
+
+def measure(repeat, func, *args):
+    samples = []
+
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+
+    return summarize(samples)
+
+
+def run_main_loop(is_done, timeout=600):
+    """Runs the main loop until is_done() returns True."""
+    loop = GLib.MainLoop()
+
+    def check():
+        if is_done():
+            loop.quit()
+            return GLib.SOURCE_REMOVE
+
+        return GLib.SOURCE_CONTINUE
+
+    def on_timeout():
+        print('Timed out waiting for the main loop', file=sys.stderr)
+        loop.quit()
+        return GLib.SOURCE_REMOVE
+
+    check_id = GLib.timeout_add(1, check)
+    timeout_id = GLib.timeout_add_seconds(timeout, on_timeout)
+
+    loop.run()
+
+    for source_id in (check_id, timeout_id):
+        source = GLib.main_context_default().find_source_by_id(source_id)
+        if source is not None:
+            source.destroy()
+
+
+class SyntheticRepository(object):
+    """A repository of many small files in a deep tree and
+       a few big files, some of the files are left modified.
+    """
+
+    def __init__(self, path, n_files, depth, n_big_files, big_lines, rng):
+        self.path = path
+        self.files = []
+        self.directories = set()
+        self.big_files = []
+
+        for i in range(n_files):
+            # Spread the files over a tree of at most depth directories
+            components = []
+            n = i
+            for level in range(rng.randint(1, depth)):
+                components.append('dir%d' % (n % 8))
+                n //= 8
+
+            self.add_file(os.path.join(*components, 'file%d.txt' % (i)),
+                          '\n'.join(make_lines(20, rng)) + '\n')
+
+        for i in range(n_big_files):
+            relative_path = 'big%d.txt' % (i)
+            self.add_file(relative_path,
+                          '\n'.join(make_lines(big_lines, rng)) + '\n')
+            self.big_files.append(relative_path)
+
+        self.git('init', '-q')
+        self.git('add', '-A')
+        self.git('-c', 'user.name=Benchmark',
+                 '-c', 'user.email=benchmark@localhost',
+                 'commit', '-q', '-m', 'Initial commit')
+
+        # Scatter edits over the big files
+        for relative_path in self.big_files:
+            full_path = os.path.join(path, relative_path)
+
+            with open(full_path) as f:
+                lines = f.read().split('\n')[:-1]
+
+            with open(full_path, 'w') as f:
+                f.write('\n'.join(edit_lines(lines, 0.001, rng)) + '\n')
+
+        # Leave some of the small files modified or untracked
+        for relative_path in rng.sample(self.files, len(self.files) // 100):
+            with open(os.path.join(path, relative_path), 'a') as f:
+                f.write('modified\n')
+
+        for i in range(len(self.files) // 100):
+            self.add_file('untracked%d.txt' % (i), 'untracked\n')
+
+        self.repo = Ggit.Repository.open(Gio.File.new_for_path(path))
+
+    def git(self, *args):
+        return subprocess.run(('git', '-C', self.path) + args, check=True,
+                              stdout=subprocess.PIPE).stdout
+
+    def add_file(self, relative_path, text):
+        full_path = os.path.join(self.path, relative_path)
+        directory = os.path.dirname(full_path)
+
+        os.makedirs(directory, exist_ok=True)
+        self.directories.add(directory)
+
+        with open(full_path, 'w') as f:
+            f.write(text)
+
+        self.files.append(relative_path)
+
+    def locations(self):
+        return [Gio.File.new_for_path(os.path.join(self.path, x))
+                for x in self.files]
+
+
+def bench_status(synthetic, args):
+    """The throughput of GitStatusThread from push() to the results
+       being delivered in the main loop, with a cold and warm cache.
+    """
+    locations = synthetic.locations()
+    results = {}
+
+    thread = GitStatusThread(StatusCaches(),
+                             lambda batch: delivered.extend(batch),
+                             batch=True)
+    thread.start()
+
+    try:
+        for name in ('cold', 'warm'):
+            delivered = []
+
+            start = time.perf_counter()
+            for location in locations:
+                thread.push(synthetic.repo, location)
+
+            run_main_loop(lambda: len(delivered) >= len(locations))
+            elapsed = time.perf_counter() - start
+
+            results[name] = {
+                'files': len(delivered),
+                'seconds': elapsed,
+                'files_per_second': len(delivered) / elapsed
+            }
+
+    finally:
+        thread.terminate()
+
+    return results
+
+
+def bench_get_repository(synthetic, args):
+    """The cost of finding the repository of every directory, compared
+       to doing a discovery for each of them.
+    """
+    directories = [Gio.File.new_for_path(x)
+                   for x in sorted(synthetic.directories)]
+
+    def discover_all():
+        for location in directories:
+            Ggit.Repository.open(Ggit.Repository.discover(location))
+
+    index = RepositoryIndex()
+
+    def lookup_all():
+        for location in directories:
+            index.lookup(location, True)
+
+    results = {'directories': len(directories)}
+    results['discover'] = measure(1, discover_all)
+    results['index_cold'] = measure(1, lookup_all)
+    results['index_warm'] = measure(args.repeat, lookup_all)
+
+    return results
+
+
+class _ViewActivatable(object):
+    """Stands in for the GitViewActivatable the results are for."""
+
+
+def _diff_cases(synthetic, args):
+    rng = random.Random(args.seed)
+
+    for n_lines in args.diff_sizes:
+        old_lines = make_lines(n_lines, rng)
+
+        for density in args.densities:
+            if density == 0:
+                new_lines = old_lines
+
+            else:
+                new_lines = edit_lines(old_lines, density, rng)
+
+            yield {'lines': n_lines, 'density': density}, old_lines, new_lines
+
+    # The big files of the repository with their scattered edits
+    for relative_path in synthetic.big_files:
+        blob = synthetic.git('show', 'HEAD:' + relative_path)
+        old_lines = blob.decode('utf-8').split('\n')[:-1]
+
+        with open(os.path.join(synthetic.path, relative_path)) as f:
+            new_lines = f.read().split('\n')[:-1]
+
+        yield {'file': relative_path, 'lines': len(new_lines)}, \
+            old_lines, new_lines
+
+
+def bench_diff(synthetic, args):
+    """The latency of what on_diff_timeout() does for a full diff,
+       the buffer snapshot and the diff thread's task, and for an
+       incremental diff after a single edit, by file size and density.
+    """
+    view_activatable = _ViewActivatable()
+    view_activatable_ref = weakref.ref(view_activatable)
+    diff_thread = GitDiffThread()
+    results = []
+
+    for case, old_lines, new_lines in _diff_cases(synthetic, args):
+        blob = ('\n'.join(old_lines) + '\n').encode('utf-8')
+        file_contents = (old_lines, diff.blob_id(blob), 'utf-8')
+
+        buf = GtkSource.Buffer()
+        buf.set_text('\n'.join(new_lines))
+
+        def full_diff():
+            start_iter, end_iter = buf.get_bounds()
+            src_contents = start_iter.get_visible_text(end_iter)
+
+            return diff_thread.handle_task(view_activatable_ref, 1,
+                                           file_contents, src_contents,
+                                           '\n')
+
+        unused, unused, (unused, hunks, unused) = full_diff()
+
+        def incremental_diff():
+            incremental = diff.IncrementalDiff(old_lines, hunks)
+
+            line = buf.get_line_count() // 2
+            buf.insert(buf.get_iter_at_line(line), 'x')
+            incremental.lines_inserted(line, 0)
+
+            window = incremental.window(buf.get_line_count())
+            if window is None:
+                return
+
+            start, end = window[4:]
+            start_iter = buf.get_iter_at_line(start)
+
+            if end < buf.get_line_count():
+                end_iter = buf.get_iter_at_line(end)
+
+            else:
+                end_iter = buf.get_end_iter()
+
+            lines = diff.split_lines(start_iter.get_visible_text(end_iter))
+            incremental.rediff(window, lines[:end - start])
+
+        case['hunks'] = len(hunks)
+        case['full'] = measure(args.repeat, full_diff)
+        case['incremental'] = measure(args.repeat, incremental_diff)
+        results.append(case)
+
+    return results
+
+
+class _EchoThread(WorkerThread):
+    def handle_task(self, pushed):
+        return pushed
+
+
+def bench_delivery(synthetic, args):
+    """The latency from WorkerThread.push() to the result callback
+       being called in the main loop, delivering one result per call
+       and in batches.
+    """
+    results = {}
+
+    for batch in (False, True):
+        latencies = []
+
+        def on_result(pushed):
+            latencies.append((GLib.get_monotonic_time() - pushed) / 1000000)
+
+        if batch:
+            def callback(pushed_list):
+                for pushed in pushed_list:
+                    on_result(pushed)
+
+        else:
+            callback = on_result
+
+        thread = _EchoThread(callback, batch=batch)
+        thread.start()
+
+        try:
+            for i in range(args.tasks):
+                thread.push(GLib.get_monotonic_time())
+
+            run_main_loop(lambda: len(latencies) >= args.tasks)
+
+        finally:
+            thread.terminate()
+
+        results['batch' if batch else 'single'] = summarize(latencies)
+
+    return results
+
+
+def parse_list(text, convert):
+    return [convert(x) for x in text.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('--depth', type=int, default=6)
+    parser.add_argument('--big-files', type=int, default=3)
+    parser.add_argument('--big-lines', type=int, default=100000)
+    parser.add_argument('--diff-sizes', default='1000,10000,100000',
+                        type=lambda x: parse_list(x, int))
+    parser.add_argument('--densities', default='0,0.0001,0.001,0.01',
+                        type=lambda x: parse_list(x, float),
+                        help='fractions of the lines that are edited')
+    parser.add_argument('--tasks', type=int, default=10000,
+                        help='tasks pushed to measure the delivery')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', default=','.join(BENCHMARKS),
+                        type=lambda x: parse_list(x, str),
+                        help='comma separated list of: %s' %
+                             (', '.join(BENCHMARKS)))
+    parser.add_argument('--output', default=None,
+                        help='write the JSON to this file')
+    args = parser.parse_args()
+
+    for name in args.only:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark "%s"' % (name))
+
+    Ggit.init()
+    rng = random.Random(args.seed)
+
+    path = tempfile.mkdtemp(prefix='gedit-git-benchmark-')
+
+    try:
+        start = time.perf_counter()
+        synthetic = SyntheticRepository(path, args.files, args.depth,
+                                        args.big_files, args.big_lines, rng)
+        setup = time.perf_counter() - start
+
+        results = {}
+        for name in args.only:
+            print('Running %s...' % (name), file=sys.stderr)
+            results[name] = globals()['bench_' + name](synthetic, args)
+
+    finally:
+        shutil.rmtree(path)
+
+    output = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {
+            'files': args.files,
+            'depth': args.depth,
+            'big_files': args.big_files,
+            'big_lines': args.big_lines,
+            'repeat': args.repeat,
+            'seed': args.seed
+        },
+        'setup_seconds': setup,
+        'results': results
+    }
+
+    if args.output is None:
+        json.dump(output, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
+
+# ex:ts=4:et:
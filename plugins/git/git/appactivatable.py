@@ -19,10 +19,22 @@
 
 from gi.repository import GLib, GObject, Gio, Gedit, Ggit
 
+from . import diff, metrics
+from .blamethread import BlameData, GitBlameThread
+from .debug import debug
+from .diffthread import GitDiffThread
+from .lrucache import LRUCache
+from .repositoryindex import RepositoryIndex
+from .statusservice import GitStatusService
+
+import os
+
 
 class GitAppActivatable(GObject.Object, Gedit.AppActivatable):
     app = GObject.Property(type=Gedit.App)
 
+    SETTINGS_SCHEMA = 'org.gnome.gedit.plugins.git'
+
     __instance = None
 
     def __init__(self):
@@ -35,94 +47,204 @@ class GitAppActivatable(GObject.Object, Gedit.AppActivatable):
     def do_activate(self):
         self.clear_repositories()
 
+        # The HEAD contents of files, keyed by the repository,
+        # commit and path. Bounded by the total number of lines.
+        self.__file_contents = LRUCache(1000000,
+                                       lambda contents: len(contents[0]) + 1)
+
+        # Shared by every view, the diffs are
+        # too expensive to do in the main loop
+        self.diff_thread = GitDiffThread()
+        self.diff_thread.start()
+
+        # Shared by every window, the threads
+        # are only started for the used repositories
+        self.status_service = GitStatusService()
+
+        # Lets the metrics be looked at with: kill -USR1 <gedit's pid>
+        self.__dump_metrics_id = 0
+        if metrics.ENABLED:
+            self.__dump_metrics_id = metrics.add_dump_signal()
+
+        # The blames are cached by the repository, commit and path,
+        # a new HEAD results in a new blame. Only started when needed.
+        self.__blames = LRUCache(32)
+        self.__blame_thread = None
+
+        self.settings = self.__get_settings()
+
     def do_deactivate(self):
-        self.__git_repos = None
-        self.__workdir_repos = None
+        if self.__dump_metrics_id:
+            GLib.source_remove(self.__dump_metrics_id)
+            self.__dump_metrics_id = 0
+
+        self.diff_thread.terminate()
+        self.diff_thread = None
+
+        self.status_service.terminate()
+        self.status_service = None
+
+        if self.__blame_thread is not None:
+            self.__blame_thread.terminate()
+            self.__blame_thread = None
+
+        self.__repository_index = None
+        self.__file_contents = None
+        self.__blames = None
+        self.settings = None
+
+    def __get_settings(self):
+        # The schema is not installed when running uninstalled
+        source = Gio.SettingsSchemaSource.get_default()
+        if source is None or source.lookup(self.SETTINGS_SCHEMA,
+                                           True) is None:
+            debug('Settings schema "%s" is not installed' %
+                  (self.SETTINGS_SCHEMA))
+            return None
+
+        return Gio.Settings.new(self.SETTINGS_SCHEMA)
+
+    def get_show_blame(self):
+        return self.settings is not None and \
+            self.settings.get_boolean('show-blame')
 
     @classmethod
     def get_instance(cls):
         return cls.__instance
 
     def clear_repositories(self):
-        self.__git_repos = {}
-        self.__workdir_repos = {}
+        self.__repository_index = RepositoryIndex()
 
-    def get_repository(self, location, is_dir, *, allow_git_dir=False):
-        # The repos are cached by the directory
-        dir_location = location if is_dir else location.get_parent()
-        dir_uri = dir_location.get_uri()
+    def clear_missing_repositories(self):
+        # A repository could have been created for these directories
+        self.__repository_index.invalidate_missing()
+
+    def invalidate_repositories(self, location):
+        """Forgets the repositories at and below the location."""
+        self.__repository_index.invalidate(location)
+
+    @staticmethod
+    def get_repository_stamp(repo):
+        """Returns a value that changes when the
+           repository's HEAD or index change.
+        """
+        git_dir = repo.get_location().get_path()
+
+        stamp = []
+        for name in ('HEAD', 'index', 'packed-refs'):
+            try:
+                stamp.append(os.stat(os.path.join(git_dir, name)).st_mtime_ns)
 
-        # Fast Path
+            except OSError:
+                stamp.append(None)
+
+        # The branch could have been updated without touching HEAD
         try:
-            return self.__workdir_repos[dir_uri]
+            stamp.append(repo.get_head().get_target().to_string())
 
-        except KeyError:
-            pass
+        except GLib.Error:
+            stamp.append(None)
+
+        return tuple(stamp)
+
+    def get_file_contents(self, repo, commit_id, relative_path):
+        """Returns a (lines, blob_id, encoding) tuple of the file in
+           the commit, the lines are an empty list and the blob_id is
+           None if the file is not in the commit.
+
+           The list is shared and must not be modified.
+        """
+        key = (repo.get_location().get_uri(),
+               commit_id.to_string(), relative_path)
 
         try:
-            repo = self.__git_repos[dir_uri]
+            contents = self.__file_contents[key]
 
         except KeyError:
-            pass
+            contents = self.__load_file_contents(repo, commit_id,
+                                                 relative_path)
+            self.__file_contents[key] = contents
 
-        else:
-            return repo if allow_git_dir else None
-
-        # Doing remote operations is too slow
-        if not location.has_uri_scheme('file'):
-            return None
+        debug('HEAD contents cache: %s' % (self.__file_contents.stats()))
+        return contents
 
-        # Must check every dir, otherwise submodules will have issues
+    def __load_file_contents(self, repo, commit_id, relative_path):
         try:
-            repo_file = Ggit.Repository.discover(location)
+            commit = repo.lookup(commit_id, Ggit.Commit)
+            tree = commit.get_tree()
+
+            entry = tree.get_by_path(relative_path)
+            blob_id = entry.get_id()
+            file_blob = repo.lookup(blob_id, Ggit.Blob)
 
         except GLib.Error:
-            # Prevent trying to find a git repository
-            # for every file in this directory
-            self.__workdir_repos[dir_uri] = None
-            return None
+            # New file in a git repository
+            return [], None, None
+
+        try:
+            gitconfig = repo.get_config()
+            encoding = gitconfig.get_string('gui.encoding')
+        except GLib.Error:
+            encoding = 'utf8'
+
+        raw_contents = file_blob.get_raw_content()
+
+        # Decoding every line of a huge file takes several times
+        # the memory of the blob, and only a window of it is diffed
+        if len(raw_contents) > diff.MAX_DIFF_SIZE and \
+                diff.BlobLines.is_supported(encoding):
+            lines = diff.BlobLines(raw_contents, encoding)
+            return lines, blob_id.to_string(), encoding
+
+        file_contents = raw_contents.decode(encoding)
+        lines = diff.split_lines(file_contents)
+
+        # Remove the last empty line, gedit does
+        # not show the file's trailing newline
+        if len(lines) > 1 and lines[-1] == '':
+            lines.pop()
 
-        repo_uri = repo_file.get_uri()
+        return lines, blob_id.to_string(), encoding
+
+    def get_blame(self, repo, commit_id, relative_path, n_lines,
+                  first_line=0):
+        """Returns the BlameData of the file in the commit, which is
+           filled in by the blame thread. The range of lines with
+           first_line in it is blamed first.
+        """
+        key = (repo.get_location().get_uri(),
+               commit_id.to_string(), relative_path)
 
-        # Reuse the repo if requested multiple times
         try:
-            repo = self.__git_repos[repo_uri]
+            return self.__blames[key]
 
         except KeyError:
-            repo = Ggit.Repository.open(repo_file)
-
-            # TODO: this was around even when not used, on purpose?
-            head = repo.get_head()
-            commit = repo.lookup(head.get_target(), Ggit.Commit)
-            tree = commit.get_tree()
+            pass
 
-            self.__git_repos[repo_uri] = repo
+        if self.__blame_thread is None:
+            self.__blame_thread = GitBlameThread()
+            self.__blame_thread.start()
 
-        # Need to keep the caches for workdir and
-        # the .git dir separate to support allow_git_dir
-        if dir_uri.startswith(repo_uri):
-            top_uri = repo_uri
-            repos = self.__git_repos
+        ranges = GitBlameThread.get_ranges(n_lines)
+        blame_data = BlameData(ranges)
+        self.__blames[key] = blame_data
 
-        else:
-            top_uri = repo.get_workdir().get_uri()
-            repos = self.__workdir_repos
+        location = repo.get_workdir().resolve_relative_path(relative_path)
 
-        # Avoid trouble with symbolic links
-        while dir_uri.startswith(top_uri):
-            repos[dir_uri] = repo
+        for line_range in ranges:
+            start, end = line_range
+            if start <= first_line < end:
+                priority = GitBlameThread.PRIORITY_HIGH
 
-            dir_location = dir_location.get_parent()
-            dir_uri = dir_location.get_uri()
+            else:
+                priority = GitBlameThread.PRIORITY_DEFAULT
 
-            # Avoid caching the repo all the
-            # way up to the top dir each time
-            if dir_uri in repos:
-                break
+            self.__blame_thread.push(blame_data, repo, location, commit_id,
+                                     line_range, priority=priority)
 
-        if repos is self.__git_repos:
-            return repo if allow_git_dir else None
+        return blame_data
 
-        return repo
+    def get_repository(self, location, is_dir, *, allow_git_dir=False):
+        return self.__repository_index.lookup(location, is_dir, allow_git_dir)
 
 # ex:ts=4:et:
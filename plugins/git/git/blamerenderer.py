@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (C) 2026 - agent <agent@local>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc.  51 Franklin Street, Fifth Floor, Boston, MA
+#  02110-1301 USA.
+
+from gi.repository import GtkSource
+
+import bisect
+
+from .diffrenderer import FileContext
+
+
+class BlameRenderer(GtkSource.GutterRendererText):
+    """Shows the commit that last changed each line.
+
+       The blame is of the lines in HEAD, the hunks of the diff
+       map the buffer's lines to them. As the hunks are shifted
+       by the edits the blame never has to be recomputed for them.
+    """
+
+    # Used to measure the width of the gutter
+    WIDEST_LABEL = '0000000 MMMMMMMMMMMM'
+
+    def __init__(self):
+        GtkSource.GutterRendererText.__init__(self)
+
+        self.set_alignment(0, 0.5)
+        self.set_padding(4, 0)
+
+        self.file_context = FileContext()
+        self.hunks = []
+        self.hunk_starts = []
+
+        self.connect('notify::view', self.on_notify_view)
+
+    def on_notify_view(self, renderer, pspec=None):
+        if self.get_view() is not None:
+            width, unused = self.measure(self.WIDEST_LABEL)
+            self.set_size(width)
+
+    def get_commit(self, line):
+        """Returns the BlameCommit of the buffer's line, which
+           starts at 0, or None if it is not committed.
+        """
+        i = bisect.bisect_right(self.hunk_starts, line) - 1
+
+        if i >= 0:
+            old_start, old_end, new_start, new_end = self.hunks[i]
+
+            # Edited lines have not been committed
+            if line < new_end:
+                return None
+
+            line = old_end + (line - new_end)
+
+        return self.file_context.get(line + 1, None)
+
+    def do_query_data(self, start, end, state):
+        commit = self.get_commit(start.get_line())
+        self.set_text(commit.label if commit is not None else '', -1)
+
+    def do_query_tooltip(self, it, area, x, y, tooltip):
+        commit = self.get_commit(it.get_line())
+        if commit is None:
+            return False
+
+        tooltip.set_markup(commit.tooltip)
+        return True
+
+    def set_file_context(self, file_context):
+        self.file_context = file_context
+        self.queue_draw()
+
+    def set_hunks(self, hunks):
+        self.hunks = hunks
+        self.hunk_starts = [hunk[2] for hunk in hunks]
+        self.queue_draw()
+
+# ex:ts=4:et:
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (C) 2026 - agent <agent@local>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc.  51 Franklin Street, Fifth Floor, Boston, MA
+#  02110-1301 USA.
+
+from gi.repository import GLib, Ggit
+
+import weakref
+
+from .debug import debug
+from .diffrenderer import FileContext
+from .workerthread import WorkerThread
+
+
+class BlameCommit(object):
+    """What the blame gutter shows of the commit that last changed
+       a line, shared by all of the lines the commit changed.
+    """
+    __slots__ = ('commit_id', 'label', 'tooltip')
+
+    def __init__(self, commit_id, label, tooltip):
+        self.commit_id = commit_id
+        self.label = label
+        self.tooltip = tooltip
+
+
+class BlameData(object):
+    """The blame of a file at a commit, the line ranges are filled
+       in as they are blamed. The file context's lines are the
+       lines of the file in the commit, not the buffer's lines.
+    """
+
+    def __init__(self, ranges):
+        self.pending = set(ranges)
+        self.file_context = FileContext()
+
+        # The view activatables showing the blame
+        self.listeners = weakref.WeakSet()
+
+        self.__intervals = []
+
+    def is_complete(self):
+        return not self.pending
+
+    def add(self, line_range, intervals):
+        self.pending.discard(line_range)
+
+        if intervals:
+            self.__intervals.extend(intervals)
+            self.__intervals.sort(key=lambda interval: interval[0])
+            self.file_context = FileContext(self.__intervals)
+
+        for listener in list(self.listeners):
+            listener.on_blame_updated(self)
+
+
+class GitBlameThread(WorkerThread):
+    """Blames files a range of lines at a time, so that the first
+       lines can be shown before the whole file has been blamed.
+    """
+
+    # The number of lines blamed by a single task
+    RANGE_SIZE = 1000
+
+    # The blame options only take 16-bit line numbers
+    MAX_RANGE_LINE = 65535
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(self.__deliver_result, *args, **kwargs)
+
+    @classmethod
+    def get_ranges(cls, n_lines):
+        """Returns the (start, end) ranges a file is blamed in,
+           the lines start at 0 and the ends are exclusive.
+        """
+        ranges = []
+
+        for start in range(0, n_lines, cls.RANGE_SIZE):
+            end = min(start + cls.RANGE_SIZE, n_lines)
+
+            # Blame all of the remaining lines at once
+            if end > cls.MAX_RANGE_LINE:
+                ranges.append((start, n_lines))
+                break
+
+            ranges.append((start, end))
+
+        return ranges
+
+    def task_key(self, blame_data, repo, location, commit_id, line_range):
+        return id(blame_data), line_range
+
+    def handle_task(self, blame_data, repo, location, commit_id, line_range):
+        start, end = line_range
+
+        options = Ggit.BlameOptions.new()
+        options.set_newest_commit(commit_id)
+
+        if end <= self.MAX_RANGE_LINE:
+            options.set_minimum_line(start + 1)
+            options.set_maximum_line(end)
+
+        try:
+            blame = Ggit.Blame.file(repo, location, options)
+
+        except GLib.Error as e:
+            debug('Failed to blame "%s": %s' % (location.get_uri(), e))
+            return blame_data, line_range, []
+
+        commits = {}
+        intervals = []
+
+        for i in range(blame.get_hunk_count()):
+            hunk = blame.get_hunk_by_index(i)
+
+            # Only keep the lines of the range, the
+            # line numbers of the intervals start at 1
+            hunk_start = hunk.get_final_start_line_number()
+            hunk_end = hunk_start + hunk.get_lines_in_hunk()
+            hunk_start = max(hunk_start, start + 1)
+            hunk_end = min(hunk_end, end + 1)
+
+            if hunk_start >= hunk_end:
+                continue
+
+            hunk_commit_id = hunk.get_final_commit_id()
+            commit_str = hunk_commit_id.to_string()
+
+            try:
+                commit = commits[commit_str]
+
+            except KeyError:
+                commit = self.__get_commit(repo, hunk_commit_id,
+                                           hunk.get_final_signature())
+                commits[commit_str] = commit
+
+            intervals.append((hunk_start, hunk_end, commit))
+
+        return blame_data, line_range, intervals
+
+    @staticmethod
+    def __get_commit(repo, commit_id, signature):
+        commit_str = commit_id.to_string()
+        name = signature.get_name()
+        date = signature.get_time().format('%Y-%m-%d')
+
+        try:
+            subject = repo.lookup(commit_id, Ggit.Commit).get_subject()
+
+        except GLib.Error:
+            subject = ''
+
+        label = '%s %s' % (commit_str[:7], name[:12])
+        tooltip = '<b>%s</b>\n%s, %s\n\n%s' % \
+            tuple(GLib.markup_escape_text(x)
+                  for x in (commit_str[:12], name, date, subject))
+
+        return BlameCommit(commit_str, label, tooltip)
+
+    def __deliver_result(self, result):
+        blame_data, line_range, intervals = result
+        blame_data.add(line_range, intervals)
+
+# ex:ts=4:et:
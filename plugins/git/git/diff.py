@@ -0,0 +1,597 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (C) 2026 - agent <agent@local>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc.  51 Franklin Street, Fifth Floor, Boston, MA
+#  02110-1301 USA.
+
+"""A line based diff engine for the gutter.
+
+   The lines are interned into integers once and then a patience
+   diff is done over the integers, the gaps between the unique
+   lines are diffed with Myers' algorithm. The result is a sorted
+   list of (old_start, old_end, new_start, new_end) hunks which
+   only contain the changed lines, the indexes start at 0 and
+   the ends are exclusive.
+
+   This module must not depend on Gtk so that it can be benchmarked.
+"""
+
+import array
+import bisect
+import codecs
+import collections
+import collections.abc
+import hashlib
+import itertools
+import os
+import re
+
+
+# The maximum edit distance Myers' algorithm will search for
+# before the whole range is considered to have been replaced
+MAX_EDIT_COST = 1024
+
+# The largest number of lines IncrementalDiff will rediff,
+# anything bigger is better done by a full diff in a thread
+MAX_WINDOW_LINES = 5000
+
+# The line terminators known by GtkTextBuffer,
+# str.splitlines() knows about many more
+_LINE_TERMINATORS = re.compile('\r\n|\r|\n|\u2029')
+
+# The line terminators in bytes, the paragraph
+# separator is only known for UTF-8
+_BYTE_LINE_TERMINATORS = re.compile(b'\r\n|\r|\n')
+_UTF8_LINE_TERMINATORS = re.compile(b'\r\n|\r|\n|\xe2\x80\xa9')
+
+# How many bytes are split at once when indexing the lines
+_INDEX_CHUNK_SIZE = 1 << 24
+
+
+def _get_max_diff_size():
+    try:
+        return int(os.getenv('GEDIT_GIT_PLUGIN_MAX_DIFF_SIZE', ''))
+
+    except ValueError:
+        return 16 * 1024 * 1024
+
+
+# Files bigger than this many bytes are not diffed as a whole, only
+# the lines around the ones being shown are. This can be changed with
+# the GEDIT_GIT_PLUGIN_MAX_DIFF_SIZE environment variable.
+MAX_DIFF_SIZE = _get_max_diff_size()
+
+# How many old lines around the window are also diffed so that
+# lines added or removed above the window are still matched
+WINDOW_MARGIN = 500
+
+
+def intern_lines(old_lines, new_lines):
+    """Returns the lines of both sides as lists of integers,
+       equal lines are mapped to the same integer.
+    """
+    # Let dict.fromkeys() do the hashing, it is much faster
+    # than assigning the integers one line at a time
+    unique_lines = dict.fromkeys(itertools.chain(old_lines, new_lines))
+    ids = {line: i for i, line in enumerate(unique_lines)}
+
+    old = list(map(ids.__getitem__, old_lines))
+    new = list(map(ids.__getitem__, new_lines))
+
+    return old, new
+
+
+def split_lines(text):
+    """Splits the text into lines the same way as GtkTextBuffer,
+       a trailing line terminator results in a trailing empty line.
+    """
+    if '\r' not in text and '\u2029' not in text:
+        return text.split('\n')
+
+    return _LINE_TERMINATORS.split(text)
+
+
+class BlobLines(collections.abc.Sequence):
+    """The lines of a blob which are only decoded when needed.
+
+       Only the raw bytes and the offsets of the lines are kept,
+       instead of a str for every line. Like gedit, the trailing
+       line terminator does not result in a trailing empty line.
+    """
+
+    def __init__(self, data, encoding):
+        self.__data = memoryview(data)
+        self.__encoding = encoding
+
+        utf8 = codecs.lookup(encoding).name == 'utf-8'
+
+        if b'\r' in data or (utf8 and b'\xe2\x80\xa9' in data):
+            terminators = _UTF8_LINE_TERMINATORS if utf8 else \
+                _BYTE_LINE_TERMINATORS
+            self.__starts = self.__index_lines(data, terminators)
+
+        else:
+            self.__starts = self.__index_newlines(data)
+
+        # The end of the last line
+        self.__starts.append(len(data))
+
+        if len(self.__starts) > 2 and self.__starts[-2] == len(data):
+            self.__starts.pop()
+
+    @staticmethod
+    def is_supported(encoding):
+        """The lines can only be found in the raw bytes if
+           the line terminators are encoded as in ASCII.
+        """
+        try:
+            return '\r\n'.encode(encoding) == b'\r\n'
+
+        except LookupError:
+            return False
+
+    @staticmethod
+    def __index_lines(data, terminators):
+        starts = array.array('q', [0])
+        starts.extend(match.end() for match in terminators.finditer(data))
+
+        return starts
+
+    @staticmethod
+    def __index_newlines(data):
+        # Splitting is much faster than searching for each newline,
+        # chunks avoid having a bytes object for every line at once
+        starts = array.array('q')
+        pos = 0
+
+        while True:
+            end = data.find(b'\n', pos + _INDEX_CHUNK_SIZE)
+            end = len(data) if end == -1 else end + 1
+
+            lengths = map(len, data[pos:end].split(b'\n'))
+            starts.extend(itertools.accumulate(map((1).__add__, lengths),
+                                               initial=pos))
+
+            # The last start is past the end of the chunk
+            starts.pop()
+            if end == len(data):
+                return starts
+
+            # The next chunk starts with its first line
+            starts.pop()
+            pos = end
+
+    def __len__(self):
+        return len(self.__starts) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+
+        if not 0 <= index < len(self):
+            raise IndexError('line index out of range')
+
+        raw = self.__data[self.__starts[index]:self.__starts[index + 1]]
+        line = str(raw, self.__encoding, 'replace')
+
+        if line.endswith('\r\n'):
+            return line[:-2]
+
+        if line and line[-1] in '\r\n\u2029':
+            return line[:-1]
+
+        return line
+
+
+def blob_id(data):
+    """Returns the hex object id git gives to a blob of the bytes."""
+    sha1 = hashlib.sha1(b'blob %d\0' % len(data))
+    sha1.update(data)
+
+    return sha1.hexdigest()
+
+
+def diff_lines(old_lines, new_lines):
+    """Returns the hunks needed to turn old_lines into new_lines."""
+    old, new = intern_lines(old_lines, new_lines)
+    return diff_ids(old, new)
+
+
+def diff_ids(old, new):
+    hunks = []
+
+    # Use a stack rather than recursion as the
+    # patience diff can split the ranges many times
+    ranges = [(0, len(old), 0, len(new))]
+    while ranges:
+        _diff_range(old, new, ranges.pop(), ranges, hunks)
+
+    hunks.sort()
+    return _merge_hunks(hunks)
+
+
+def _diff_range(old, new, bounds, ranges, hunks):
+    old_start, old_end, new_start, new_end = bounds
+
+    # Skip the common prefix and suffix, for
+    # most edits this is all that is required
+    while old_start < old_end and new_start < new_end and \
+            old[old_start] == new[new_start]:
+        old_start += 1
+        new_start += 1
+
+    while old_start < old_end and new_start < new_end and \
+            old[old_end - 1] == new[new_end - 1]:
+        old_end -= 1
+        new_end -= 1
+
+    if old_start == old_end and new_start == new_end:
+        return
+
+    if old_start == old_end or new_start == new_end:
+        hunks.append((old_start, old_end, new_start, new_end))
+        return
+
+    anchors = _patience_anchors(old, old_start, old_end,
+                                new, new_start, new_end)
+
+    if anchors:
+        for old_anchor, new_anchor in anchors:
+            # Most of the gaps between the anchors are only
+            # made of equal lines, avoid queueing those
+            while old_start < old_anchor and new_start < new_anchor and \
+                    old[old_start] == new[new_start]:
+                old_start += 1
+                new_start += 1
+
+            if old_start != old_anchor or new_start != new_anchor:
+                ranges.append((old_start, old_anchor,
+                               new_start, new_anchor))
+
+            old_start = old_anchor + 1
+            new_start = new_anchor + 1
+
+        ranges.append((old_start, old_end, new_start, new_end))
+        return
+
+    if not _myers(old, old_start, old_end,
+                  new, new_start, new_end, hunks):
+        # Too different to be worth the cost
+        hunks.append((old_start, old_end, new_start, new_end))
+
+
+def _patience_anchors(old, old_start, old_end, new, new_start, new_end):
+    old_counts = collections.Counter(old[old_start:old_end])
+    new_counts = collections.Counter(new[new_start:new_end])
+
+    unique = {line for line, count in new_counts.items()
+              if count == 1 and old_counts.get(line, 0) == 1}
+
+    if not unique:
+        return []
+
+    new_positions = {line: i
+                     for i, line in enumerate(new[new_start:new_end],
+                                              new_start)
+                     if line in unique}
+
+    pairs = [(i, new_positions[line])
+             for i, line in enumerate(old[old_start:old_end], old_start)
+             if line in unique]
+
+    # Longest increasing subsequence of the
+    # new positions ordered by the old positions
+    tails = []
+    tail_indexes = []
+    previous = [-1] * len(pairs)
+
+    for index, (unused, new_pos) in enumerate(pairs):
+        pos = bisect.bisect_left(tails, new_pos)
+
+        if pos > 0:
+            previous[index] = tail_indexes[pos - 1]
+
+        if pos == len(tails):
+            tails.append(new_pos)
+            tail_indexes.append(index)
+
+        else:
+            tails[pos] = new_pos
+            tail_indexes[pos] = index
+
+    anchors = []
+    index = tail_indexes[-1]
+    while index != -1:
+        anchors.append(pairs[index])
+        index = previous[index]
+
+    anchors.reverse()
+    return anchors
+
+
+def _myers(old, old_start, old_end, new, new_start, new_end, hunks):
+    n = old_end - old_start
+    m = new_end - new_start
+    max_cost = min(n + m, MAX_EDIT_COST)
+
+    offset = max_cost + 1
+    v = [0] * (2 * max_cost + 3)
+    trace = []
+
+    for d in range(max_cost + 1):
+        trace.append(v[offset - d - 1:offset + d + 2])
+
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+
+            else:
+                x = v[offset + k - 1] + 1
+
+            y = x - k
+            while x < n and y < m and \
+                    old[old_start + x] == new[new_start + y]:
+                x += 1
+                y += 1
+
+            v[offset + k] = x
+
+            if x >= n and y >= m:
+                _myers_hunks(trace, n, m, old_start, new_start, hunks)
+                return True
+
+    return False
+
+
+def _myers_hunks(trace, n, m, old_start, new_start, hunks):
+    # Walk backwards through the trace collecting the
+    # diagonals as (old position, new position, length)
+    snakes = []
+    x, y = n, m
+
+    for d in range(len(trace) - 1, 0, -1):
+        # The trace for d only holds the diagonals -d - 1 to d + 1
+        v = trace[d]
+        k = x - y
+
+        if k == -d or (k != d and v[k + d] < v[k + d + 2]):
+            prev_k = k + 1
+            snake_x = v[prev_k + d + 1]
+
+        else:
+            prev_k = k - 1
+            snake_x = v[prev_k + d + 1] + 1
+
+        if x > snake_x:
+            snakes.append((snake_x, snake_x - k, x - snake_x))
+
+        x = v[prev_k + d + 1]
+        y = x - prev_k
+
+    if x > 0:
+        snakes.append((0, 0, x))
+
+    old_pos = new_pos = 0
+    for snake_x, snake_y, length in reversed(snakes):
+        if snake_x > old_pos or snake_y > new_pos:
+            hunks.append((old_start + old_pos, old_start + snake_x,
+                          new_start + new_pos, new_start + snake_y))
+
+        old_pos = snake_x + length
+        new_pos = snake_y + length
+
+    if old_pos < n or new_pos < m:
+        hunks.append((old_start + old_pos, old_start + n,
+                      new_start + new_pos, new_start + m))
+
+
+def _merge_hunks(hunks):
+    merged = []
+
+    for hunk in hunks:
+        if merged and merged[-1][1] == hunk[0] and merged[-1][3] == hunk[2]:
+            previous = merged[-1]
+            merged[-1] = (previous[0], hunk[1], previous[2], hunk[3])
+
+        else:
+            merged.append(hunk)
+
+    return merged
+
+
+def diff_window(old_lines, new_lines, new_start):
+    """Returns the hunks of the new_lines, which start at new_start,
+       without diffing all of the old_lines. The lines around the
+       window are assumed to be equal so only the old lines near
+       the same position, give or take WINDOW_MARGIN, are diffed.
+    """
+    new_end = new_start + len(new_lines)
+    old_start = max(0, min(new_start, len(old_lines)) - WINDOW_MARGIN)
+    old_end = min(new_end + WINDOW_MARGIN, len(old_lines))
+
+    hunks = [(old_start + hunk[0], old_start + hunk[1],
+              new_start + hunk[2], new_start + hunk[3])
+             for hunk in diff_lines(old_lines[old_start:old_end], new_lines)]
+
+    # The margins are removed at the edges of the window,
+    # they belong to the lines outside of the window
+    if hunks and hunks[0][0] == old_start and \
+            hunks[0][2] == hunks[0][3] == new_start:
+        hunks.pop(0)
+
+    if hunks and hunks[-1][1] == old_end and \
+            hunks[-1][2] == hunks[-1][3] == new_end:
+        hunks.pop()
+
+    return hunks
+
+
+class IncrementalDiff(object):
+    """Keeps the hunks of a diff valid while the new lines are edited.
+
+       Edits only shift the hunks after them and mark their lines as
+       dirty, rediff() then only diffs the dirty window. The lines
+       outside of the hunks are equal on both sides which is what
+       allows the window to be mapped back to the old lines.
+    """
+
+    def __init__(self, old_lines, hunks):
+        self.old_lines = old_lines
+        self.hunks = hunks
+        self.dirty = None
+
+    def __mark_dirty(self, start, end):
+        if self.dirty is None:
+            self.dirty = (start, end)
+
+        else:
+            self.dirty = (min(self.dirty[0], start), max(self.dirty[1], end))
+
+    def lines_inserted(self, line, count):
+        """count new line terminators were inserted in line."""
+        if count != 0:
+            hunks = []
+            for old_start, old_end, new_start, new_end in self.hunks:
+                if new_start > line:
+                    new_start += count
+                    new_end += count
+
+                elif new_end > line:
+                    new_end += count
+
+                hunks.append((old_start, old_end, new_start, new_end))
+
+            self.hunks = hunks
+
+            if self.dirty is not None:
+                start, end = self.dirty
+                self.dirty = (start + count if start > line else start,
+                              end + count if end > line else end)
+
+        self.__mark_dirty(line, line + count + 1)
+
+    def lines_deleted(self, start_line, end_line):
+        """The lines from start_line to end_line were joined."""
+        count = end_line - start_line
+
+        if count != 0:
+            hunks = []
+            for old_start, old_end, new_start, new_end in self.hunks:
+                if new_start > end_line:
+                    new_start -= count
+                    new_end -= count
+
+                elif new_end > start_line:
+                    # Overlapping hunks are made to cover the joined line,
+                    # too big is fine as they will be part of the window
+                    new_start = min(new_start, start_line)
+                    new_end = max(new_end - count, start_line + 1)
+
+                hunks.append((old_start, old_end, new_start, new_end))
+
+            self.hunks = hunks
+
+            if self.dirty is not None:
+                start, end = self.dirty
+
+                if start > end_line:
+                    start -= count
+
+                elif start > start_line:
+                    start = start_line
+
+                if end > end_line:
+                    end -= count
+
+                elif end > start_line:
+                    end = start_line + 1
+
+                self.dirty = (start, end)
+
+        self.__mark_dirty(start_line, start_line + 1)
+
+    def window(self, n_new_lines):
+        """Returns the window which must be rediffed or None if a full diff
+           is required. The window is a tuple of the indexes of the hunks
+           it replaces and the old and new lines it covers:
+           (first, last, old_start, old_end, new_start, new_end).
+        """
+        if self.dirty is None:
+            return None
+
+        start = min(self.dirty[0], n_new_lines)
+        end = min(self.dirty[1], n_new_lines)
+
+        # Include the hunks that overlap or touch the dirty lines
+        first = 0
+        while first < len(self.hunks) and self.hunks[first][3] < start:
+            first += 1
+
+        last = first
+        while last < len(self.hunks) and self.hunks[last][2] <= end:
+            start = min(start, self.hunks[last][2])
+            end = max(end, self.hunks[last][3])
+            last += 1
+
+        end = min(end, n_new_lines)
+
+        if end - start > MAX_WINDOW_LINES:
+            return None
+
+        # The lines around the window are equal
+        # on both sides, so offset from those
+        if first > 0:
+            previous = self.hunks[first - 1]
+            old_start = previous[1] + (start - previous[3])
+
+        else:
+            old_start = start
+
+        if last < len(self.hunks):
+            following = self.hunks[last]
+            old_end = following[0] - (following[2] - end)
+
+        else:
+            old_end = len(self.old_lines) - (n_new_lines - end)
+
+        if not 0 <= old_start <= old_end <= len(self.old_lines):
+            return None
+
+        return first, last, old_start, old_end, start, end
+
+    def rediff(self, window, new_lines):
+        """Replaces the hunks in the window with
+           the diff against the window's new_lines.
+        """
+        first, last, old_start, old_end, new_start, new_end = window
+
+        window_hunks = [(old_start + hunk[0], old_start + hunk[1],
+                         new_start + hunk[2], new_start + hunk[3])
+                        for hunk in diff_lines(self.old_lines[old_start:
+                                                              old_end],
+                                               new_lines)]
+
+        hunks = self.hunks[:first]
+        hunks.extend(window_hunks)
+        hunks.extend(self.hunks[last:])
+
+        self.hunks = _merge_hunks(hunks)
+        self.dirty = None
+
+# ex:ts=4:et:
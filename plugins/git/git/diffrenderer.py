@@ -19,6 +19,8 @@
 
 from gi.repository import Gdk, Gtk, GtkSource
 
+import bisect
+
 
 class DiffType:
     (NONE,
@@ -27,6 +29,58 @@ class DiffType:
      REMOVED) = range(4)
 
 
+class LineContext:
+    __slots__ = ('line_type', 'old_lines', 'old_start', 'old_end')
+
+    def __init__(self, line_type=DiffType.NONE,
+                 old_lines=(), old_start=0, old_end=0):
+        self.line_type = line_type
+
+        # The removed lines are only sliced out of the old
+        # lines when needed, most are never shown
+        self.old_lines = old_lines
+        self.old_start = old_start
+        self.old_end = old_end
+
+    def get_removed_lines(self, max_lines=None):
+        end = self.old_end
+        if max_lines is not None:
+            end = min(end, self.old_start + max_lines)
+
+        return self.old_lines[self.old_start:end]
+
+
+class FileContext:
+    """The line contexts of a file as sorted intervals of
+       (start, end, line_context), the lines start at 1
+       and the ends are exclusive.
+    """
+    __slots__ = ('__starts', '__ends', '__line_contexts', '__n_lines')
+
+    def __init__(self, intervals=()):
+        self.__starts = []
+        self.__ends = []
+        self.__line_contexts = []
+        self.__n_lines = 0
+
+        for start, end, line_context in intervals:
+            self.__starts.append(start)
+            self.__ends.append(end)
+            self.__line_contexts.append(line_context)
+            self.__n_lines += end - start
+
+    def __len__(self):
+        return self.__n_lines
+
+    def get(self, line, default=None):
+        i = bisect.bisect_right(self.__starts, line) - 1
+
+        if i < 0 or line >= self.__ends[i]:
+            return default
+
+        return self.__line_contexts[i]
+
+
 class DiffRenderer(GtkSource.GutterRenderer):
 
     backgrounds = {}
@@ -43,9 +97,12 @@ class DiffRenderer(GtkSource.GutterRenderer):
         self.set_size(8)
         self.set_padding(3, 0)
 
-        self.file_context = {}
+        self.file_context = FileContext()
+
+        # A single view is reused for every tooltip
         self.tooltip = None
-        self.tooltip_line = 0
+        self.tooltip_settings = None
+        self.tooltip_line_context = None
 
     def do_draw(self, cr, bg_area, cell_area, start, end, state):
         GtkSource.GutterRenderer.do_draw(self, cr, bg_area, cell_area,
@@ -69,58 +126,83 @@ class DiffRenderer(GtkSource.GutterRenderer):
         if line_context is None:
             return False
 
+        if line_context.line_type not in (DiffType.REMOVED, DiffType.MODIFIED):
+            return False
+
+        # Even for the same text, the style or font could have changed
+        content_view = self.get_view()
+        self.update_tooltip_settings(content_view)
+
         # Check that the context is the same not the line this
         # way contexts that span multiple times are handled correctly
-        if self.file_context.get(self.tooltip_line, None) is line_context:
+        if line_context is self.tooltip_line_context:
             tooltip.set_custom(None)
             tooltip.set_custom(self.tooltip)
             return True
 
-        if line_context.line_type not in (DiffType.REMOVED, DiffType.MODIFIED):
-            return False
+        # Only add what can be shown, we
+        # don't want to add hundreds of lines
+        allocation = content_view.get_allocation()
+        lines = allocation.height // area.height
+        removed = '\n'.join(map(str, line_context.get_removed_lines(lines)))
+        self.tooltip.get_buffer().set_text(removed)
 
-        tooltip_buffer = GtkSource.Buffer()
-        tooltip_view = GtkSource.View.new_with_buffer(tooltip_buffer)
+        # Avoid having to set the text multiple times
+        self.tooltip_line_context = line_context
+
+        tooltip.set_custom(None)
+        tooltip.set_custom(self.tooltip)
+        return True
+
+    def update_tooltip_settings(self, content_view):
+        """Creates the tooltip's view once and only propagates
+           the settings of the content view when they change.
+        """
+        content_buffer = content_view.get_buffer()
+        content_style_context = content_view.get_style_context()
+        content_font = content_style_context.get_font(Gtk.StateFlags.NORMAL)
+
+        settings = (content_view.get_indent_width(),
+                    content_view.get_tab_width(),
+                    content_buffer.get_highlight_syntax(),
+                    content_buffer.get_language(),
+                    content_buffer.get_style_scheme(),
+                    content_font.to_string())
+
+        if self.tooltip is not None and settings == self.tooltip_settings:
+            return
+
+        if self.tooltip is None:
+            tooltip_buffer = GtkSource.Buffer()
+            self.tooltip = GtkSource.View.new_with_buffer(tooltip_buffer)
+
+            # Fix some styling issues
+            tooltip_buffer.set_highlight_matching_brackets(False)
+            self.tooltip.set_border_width(4)
+            self.tooltip.set_cursor_visible(False)
+
+        tooltip_view = self.tooltip
+        tooltip_buffer = tooltip_view.get_buffer()
 
         # Propagate the view's settings
-        content_view = self.get_view()
         tooltip_view.set_indent_width(content_view.get_indent_width())
         tooltip_view.set_tab_width(content_view.get_tab_width())
 
         # Propagate the buffer's settings
-        content_buffer = content_view.get_buffer()
         tooltip_buffer.set_highlight_syntax(content_buffer.get_highlight_syntax())
         tooltip_buffer.set_language(content_buffer.get_language())
         tooltip_buffer.set_style_scheme(content_buffer.get_style_scheme())
 
-        # Fix some styling issues
-        tooltip_buffer.set_highlight_matching_brackets(False)
-        tooltip_view.set_border_width(4)
-        tooltip_view.set_cursor_visible(False)
-
         # Set the font
-        content_style_context = content_view.get_style_context()
-        content_font = content_style_context.get_font(Gtk.StateFlags.NORMAL)
         tooltip_view.override_font(content_font)
 
-        # Only add what can be shown, we
-        # don't want to add hundreds of lines
-        allocation = content_view.get_allocation()
-        lines = allocation.height // area.height
-        removed = '\n'.join(map(str, line_context.removed_lines[:lines]))
-        tooltip_buffer.set_text(removed)
-
-        # Avoid having to create the tooltip multiple times
-        self.tooltip = tooltip_view
-        self.tooltip_line = line
-
-        tooltip.set_custom(tooltip_view)
-        return True
+        self.tooltip_settings = settings
 
     def set_file_context(self, file_context):
         self.file_context = file_context
-        self.tooltip = None
-        self.tooltip_line = 0
+
+        # The tooltip's view is kept, only its text has to be replaced
+        self.tooltip_line_context = None
 
         self.queue_draw()
 
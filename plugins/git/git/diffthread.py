@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (C) 2026 - agent <agent@local>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc.  51 Franklin Street, Fifth Floor, Boston, MA
+#  02110-1301 USA.
+
+import weakref
+
+from gi.repository import Ggit
+
+from . import diff
+from .diffrenderer import DiffType, FileContext, LineContext
+from .workerthread import WorkerThread
+
+
+def file_context_from_hunks(file_contents_list, hunks):
+    intervals = []
+
+    for old_start, old_end, new_start, new_end in hunks:
+        if old_start == old_end:
+            line_type = DiffType.ADDED
+
+        elif new_start == new_end:
+            line_type = DiffType.REMOVED
+
+            # Shown on the line before the removed lines,
+            # or the first line if they were at the start
+            new_start = max(new_start - 1, 0)
+            new_end = new_start + 1
+
+        else:
+            line_type = DiffType.MODIFIED
+
+        line_context = LineContext(line_type, file_contents_list,
+                                   old_start, old_end)
+        intervals.append((new_start + 1, new_end + 1, line_context))
+
+    return FileContext(intervals)
+
+
+class GitDiffThread(WorkerThread):
+    """Computes the gutter's file context away from the main loop.
+
+       Each task carries a snapshot of the buffer's text and the
+       generation it was taken at. The views are only used in the
+       main loop, which drops the results for a generation that
+       has been superseded by another snapshot.
+
+       The snapshot is first hashed the same way git hashes blobs,
+       if it matches the HEAD blob the diff is not needed at all.
+       For files too big to diff, only the hash is used to tell
+       their status.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(self.__deliver_result, *args, **kwargs)
+
+    def push(self, view_activatable, generation, file_contents,
+             src_contents, trailing_newline='', *, status_only=False):
+        # Don't keep closed views alive
+        super().push(weakref.ref(view_activatable), generation,
+                     file_contents, src_contents, trailing_newline,
+                     status_only=status_only)
+
+    def task_key(self, view_activatable_ref, *args, status_only=False):
+        # Only the newest snapshot of a view is worth diffing
+        return view_activatable_ref, status_only
+
+    def handle_task(self, view_activatable_ref, generation,
+                    file_contents, src_contents, trailing_newline,
+                    status_only=False):
+        file_contents_list, file_blob_id, encoding = file_contents
+
+        unchanged = file_blob_id is not None and \
+            self.__is_unchanged(file_blob_id, encoding,
+                                src_contents + trailing_newline)
+
+        if status_only:
+            if unchanged:
+                status = Ggit.StatusFlags.CURRENT
+
+            else:
+                status = Ggit.StatusFlags.WORKING_TREE_MODIFIED
+
+            return view_activatable_ref, 'on_status_finished', \
+                (generation, status)
+
+        if unchanged:
+            return view_activatable_ref, 'on_diff_finished', \
+                (generation, [], FileContext())
+
+        hunks = diff.diff_lines(file_contents_list,
+                                diff.split_lines(src_contents))
+        file_context = file_context_from_hunks(file_contents_list, hunks)
+
+        return view_activatable_ref, 'on_diff_finished', \
+            (generation, hunks, file_context)
+
+    @staticmethod
+    def __is_unchanged(file_blob_id, encoding, src_contents):
+        try:
+            data = src_contents.encode(encoding)
+
+        except UnicodeError:
+            return False
+
+        return file_blob_id == diff.blob_id(data)
+
+    def __deliver_result(self, result):
+        if result is None:
+            return
+
+        view_activatable_ref, method, args = result
+
+        view_activatable = view_activatable_ref()
+        if view_activatable is not None:
+            getattr(view_activatable, method)(*args)
+
+# ex:ts=4:et:
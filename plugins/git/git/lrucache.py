@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (C) 2026 - agent <agent@local>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc.  51 Franklin Street, Fifth Floor, Boston, MA
+#  02110-1301 USA.
+
+import collections
+
+
+class LRUCache(object):
+    """A mapping which drops the least recently used items once the
+       total size of the items is over max_size. The size of an item
+       is given by the sizeof function, by default each item is 1.
+    """
+
+    def __init__(self, max_size, sizeof=None):
+        self.__max_size = max_size
+        self.__sizeof = sizeof if sizeof is not None else lambda value: 1
+
+        self.__items = collections.OrderedDict()
+        self.__size = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.__items)
+
+    def __contains__(self, key):
+        return key in self.__items
+
+    def __iter__(self):
+        return iter(list(self.__items))
+
+    def __getitem__(self, key):
+        try:
+            value, size = self.__items[key]
+
+        except KeyError:
+            self.misses += 1
+            raise
+
+        self.hits += 1
+        self.__items.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self.__items:
+            del self[key]
+
+        size = self.__sizeof(value)
+        self.__items[key] = (value, size)
+        self.__size += size
+
+        # Always keep the newest item, even if it is too big
+        while self.__size > self.__max_size and len(self.__items) > 1:
+            unused, (old_value, old_size) = self.__items.popitem(last=False)
+            self.__size -= old_size
+
+    def __delitem__(self, key):
+        value, size = self.__items.pop(key)
+        self.__size -= size
+
+    def peek(self, key, default=None):
+        """Like get() but does not change the order or the counters."""
+        try:
+            return self.__items[key][0]
+
+        except KeyError:
+            return default
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+
+        except KeyError:
+            return default
+
+    def pop(self, key, default=None):
+        try:
+            value, size = self.__items.pop(key)
+
+        except KeyError:
+            return default
+
+        self.__size -= size
+        return value
+
+    def clear(self):
+        self.__items.clear()
+        self.__size = 0
+
+    def stats(self):
+        return '%d items, size %d/%d, %d hits, %d misses' % \
+            (len(self.__items), self.__size, self.__max_size,
+             self.hits, self.misses)
+
+# ex:ts=4:et:
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (C) 2026 - agent <agent@local>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc.  51 Franklin Street, Fifth Floor, Boston, MA
+#  02110-1301 USA.
+
+"""Histograms of the timings and sizes of the plugin's work.
+
+   Like debug() the metrics are only recorded when an enviroment
+   variable, GEDIT_METRICS_GIT_PLUGIN, exists. They are then written
+   to stderr when the process receives SIGUSR1. The durations are
+   recorded in microseconds.
+"""
+
+import io
+import os
+import signal
+import sys
+import threading
+import time
+
+from gi.repository import GLib
+
+
+class Histogram(object):
+    """Counts the values in buckets of powers of two."""
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+        # Bucket i holds the values below 2 ** i
+        self.buckets = {}
+
+    def record(self, value):
+        value = int(value)
+
+        self.count += 1
+        self.total += value
+
+        if self.min is None or value < self.min:
+            self.min = value
+
+        if self.max is None or value > self.max:
+            self.max = value
+
+        bucket = max(value, 0).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, fraction):
+        """Returns the upper bound of the bucket with the percentile."""
+        remaining = self.count * fraction
+
+        for bucket in sorted(self.buckets):
+            remaining -= self.buckets[bucket]
+            if remaining <= 0:
+                return min(2 ** bucket - 1, self.max)
+
+        return self.max
+
+
+ENABLED = os.getenv('GEDIT_METRICS_GIT_PLUGIN') is not None
+
+_lock = threading.Lock()
+_histograms = {}
+
+
+def now():
+    """The time to pass to record_duration(), in microseconds."""
+    return int(time.monotonic() * 1000000)
+
+
+def record(name, value):
+    if not ENABLED:
+        return
+
+    with _lock:
+        try:
+            histogram = _histograms[name]
+
+        except KeyError:
+            histogram = _histograms[name] = Histogram()
+
+        histogram.record(value)
+
+
+def record_duration(name, start):
+    """Records the time since start, which was returned by now()."""
+    if ENABLED:
+        record(name, now() - start)
+
+
+def size_bucket(n_lines):
+    """Returns the name of the power of ten the number of lines is below,
+       used to compare the durations of similarly sized files.
+    """
+    bound = 1000
+    while n_lines >= bound:
+        bound *= 10
+
+    return '<%d' % (bound)
+
+
+def clear():
+    with _lock:
+        _histograms.clear()
+
+
+def dump(file=None):
+    """Writes every histogram to file, stderr by default."""
+    if file is None:
+        file = sys.stderr
+
+    output = io.StringIO()
+    output.write('git plugin metrics:\n')
+
+    # The histograms are still being recorded to by the threads
+    with _lock:
+        for name, histogram in sorted(_histograms.items()):
+            output.write('  %s: count %d, mean %d, min %d, p50 %d, '
+                         'p95 %d, max %d\n' %
+                         (name, histogram.count,
+                          histogram.total // histogram.count, histogram.min,
+                          histogram.percentile(0.5),
+                          histogram.percentile(0.95), histogram.max))
+
+            output.write('   ')
+            for bucket in sorted(histogram.buckets):
+                output.write(' <%d: %d' % (2 ** bucket,
+                                           histogram.buckets[bucket]))
+
+            output.write('\n')
+
+    # Write the metrics in a single call like debug() does
+    file.write(output.getvalue())
+    file.flush()
+
+
+def _on_dump_signal():
+    dump()
+    return GLib.SOURCE_CONTINUE
+
+
+def add_dump_signal():
+    """Dumps the metrics whenever SIGUSR1 is received,
+       returns the source id to remove the handler with.
+    """
+    return GLib.unix_signal_add(GLib.PRIORITY_LOW, signal.SIGUSR1,
+                                _on_dump_signal)
+
+# ex:ts=4:et:
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (C) 2026 - agent <agent@local>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc.  51 Franklin Street, Fifth Floor, Boston, MA
+#  02110-1301 USA.
+
+from gi.repository import GLib, Gio, Ggit
+
+import os
+
+from .debug import debug
+from .lrucache import LRUCache
+
+
+class _Root(object):
+    """The top directory of a repository's workdir or git dir.
+       A root without a git_dir_uri is known to not be in a repository.
+    """
+    __slots__ = ('git_dir_uri', 'is_git_dir')
+
+    def __init__(self, git_dir_uri, is_git_dir):
+        self.git_dir_uri = git_dir_uri
+        self.is_git_dir = is_git_dir
+
+
+_NO_REPOSITORY = _Root(None, False)
+
+
+class _Node(object):
+    __slots__ = ('children', 'root')
+
+    def __init__(self):
+        self.children = {}
+        self.root = None
+
+
+class RepositoryIndex(object):
+    """Finds the repository of directories.
+
+       The roots of the repositories are kept in a trie of the path's
+       components, so a directory below a known root only has to be
+       checked for a .git instead of doing a full discovery. The
+       repositories are only opened when needed and only the most
+       recently used ones are kept open.
+    """
+
+    def __init__(self, max_repositories=16, max_directories=4096):
+        self.__trie = _Node()
+
+        # Directory uri -> _Root
+        self.__directories = LRUCache(max_directories)
+
+        # Git dir uri -> Ggit.Repository
+        self.__repositories = LRUCache(max_repositories)
+
+    @staticmethod
+    def __components(path):
+        return [x for x in path.split(os.sep) if x]
+
+    def __find_root(self, path):
+        """Returns the deepest root above or at path and
+           the path components between it and path.
+        """
+        components = self.__components(path)
+
+        node = self.__trie
+        root = None
+        depth = 0
+
+        for i, component in enumerate(components):
+            try:
+                node = node.children[component]
+
+            except KeyError:
+                break
+
+            if node.root is not None:
+                root = node.root
+                depth = i + 1
+
+        return root, components[:depth], components[depth:]
+
+    def __add_root(self, path, root):
+        node = self.__trie
+        for component in self.__components(path):
+            node = node.children.setdefault(component, _Node())
+
+        node.root = root
+
+    def __has_git(self, root_components, components):
+        # Any of these directories could be a
+        # submodule or another nested repository
+        path = os.sep + os.sep.join(root_components)
+
+        for component in components:
+            path = os.path.join(path, component)
+
+            if os.path.lexists(os.path.join(path, '.git')):
+                return True
+
+        return False
+
+    def __discover(self, dir_location):
+        path = dir_location.get_path()
+
+        root, root_components, components = self.__find_root(path)
+        if root is not None and \
+                not self.__has_git(root_components, components):
+            return root
+
+        try:
+            git_dir = Ggit.Repository.discover(dir_location)
+
+        except GLib.Error:
+            # Nothing above this directory is a repository
+            self.__add_root(path, _NO_REPOSITORY)
+            return _NO_REPOSITORY
+
+        git_dir_uri = git_dir.get_uri()
+
+        if git_dir.get_basename() == '.git':
+            workdir = git_dir.get_parent()
+
+        else:
+            # A bare repository or a submodule's git dir
+            repo = self.__open(git_dir_uri)
+            workdir = repo.get_workdir() if repo is not None else None
+
+        git_dir_root = _Root(git_dir_uri, True)
+        self.__add_root(git_dir.get_path(), git_dir_root)
+
+        if dir_location.get_uri().startswith(git_dir_uri):
+            return git_dir_root
+
+        workdir_root = _Root(git_dir_uri, False)
+        if workdir is not None:
+            self.__add_root(workdir.get_path(), workdir_root)
+
+        return workdir_root
+
+    def __open(self, git_dir_uri):
+        try:
+            return self.__repositories[git_dir_uri]
+
+        except KeyError:
+            pass
+
+        try:
+            repo = Ggit.Repository.open(Gio.File.new_for_uri(git_dir_uri))
+
+        except GLib.Error as e:
+            debug('Failed to open repository "%s": %s' % (git_dir_uri, e))
+            return None
+
+        self.__repositories[git_dir_uri] = repo
+        return repo
+
+    def lookup(self, location, is_dir, allow_git_dir=False):
+        # The repos are cached by the directory
+        dir_location = location if is_dir else location.get_parent()
+        dir_uri = dir_location.get_uri()
+
+        try:
+            root = self.__directories[dir_uri]
+
+        except KeyError:
+            # Doing remote operations is too slow
+            if not location.has_uri_scheme('file'):
+                return None
+
+            root = self.__discover(dir_location)
+            self.__directories[dir_uri] = root
+
+            debug('Repository index: %s' % (self.stats()))
+
+        if root.git_dir_uri is None:
+            return None
+
+        if root.is_git_dir and not allow_git_dir:
+            return None
+
+        return self.__open(root.git_dir_uri)
+
+    def invalidate(self, location):
+        """Forgets about the repositories at and below the location."""
+        components = self.__components(location.get_path())
+
+        parent = None
+        node = self.__trie
+        for component in components:
+            parent = node
+            node = node.children.get(component)
+
+            if node is None:
+                break
+
+        else:
+            if parent is None:
+                self.__trie = _Node()
+
+            else:
+                del parent.children[components[-1]]
+
+        uri = location.get_uri()
+        prefix = uri.rstrip('/') + '/'
+
+        for cache in (self.__directories, self.__repositories):
+            for key in cache:
+                if key == uri or key.startswith(prefix):
+                    del cache[key]
+
+    def invalidate_missing(self):
+        """Forgets about the directories which were
+           not in a repository, one could have been created.
+        """
+        nodes = [self.__trie]
+        while nodes:
+            node = nodes.pop()
+            if node.root is _NO_REPOSITORY:
+                node.root = None
+
+            nodes.extend(node.children.values())
+
+        for dir_uri in self.__directories:
+            if self.__directories.peek(dir_uri) is _NO_REPOSITORY:
+                del self.__directories[dir_uri]
+
+    def stats(self):
+        return 'directories: %s; repositories: %s' % \
+            (self.__directories.stats(), self.__repositories.stats())
+
+# ex:ts=4:et:
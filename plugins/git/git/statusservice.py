@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (C) 2013-2014 - Garrett Regier
+#  Copyright (C) 2026 - agent <agent@local>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc.  51 Franklin Street, Fifth Floor, Boston, MA
+#  02110-1301 USA.
+
+from gi.repository import GLib, Ggit
+
+import threading
+import weakref
+
+from .debug import debug
+from .workerthread import WorkerThread
+
+
+class StatusCache(object):
+    """The statuses of a repository's files from a single status scan,
+       which is much faster than getting the status of each file.
+    """
+    __slots__ = ('__statuses', '__has_dirs')
+
+    def __init__(self, repo):
+        self.__statuses = {}
+        self.__has_dirs = False
+
+        # Untracked and ignored directories are not recursed
+        # into, they are only listed once with a trailing slash
+        flags = Ggit.StatusOption.INCLUDE_UNTRACKED | \
+            Ggit.StatusOption.INCLUDE_IGNORED
+        options = Ggit.StatusOptions.new(flags,
+                                         Ggit.StatusShow.INDEX_AND_WORKDIR,
+                                         None)
+
+        repo.file_status_foreach(options, self.__add_status)
+
+    def __add_status(self, path, status, *args):
+        self.__statuses[path] = status
+
+        if path.endswith('/'):
+            self.__has_dirs = True
+
+        return 0
+
+    def __getitem__(self, path):
+        try:
+            return self.__statuses[path]
+
+        except KeyError:
+            pass
+
+        if self.__has_dirs:
+            while '/' in path:
+                path = path.rsplit('/', 1)[0]
+
+                try:
+                    return self.__statuses[path + '/']
+
+                except KeyError:
+                    pass
+
+        # Files without changes are not listed
+        return Ggit.StatusFlags.CURRENT
+
+    def __setitem__(self, path, status):
+        self.__statuses[path] = status
+
+
+class StatusCaches(object):
+    """The StatusCache of each repository, keyed by the repository's uri.
+       They are shared by the status threads, so a repository's cache
+       is kept when its thread is stopped.
+    """
+
+    def __init__(self):
+        self.__status_caches = {}
+        self.__lock = threading.Lock()
+
+    def invalidate(self, repo=None):
+        with self.__lock:
+            if repo is None:
+                self.__status_caches.clear()
+
+            else:
+                self.__status_caches.pop(repo.get_location().get_uri(), None)
+
+    def get(self, repo, repo_uri):
+        """Returns the repository's cache, scanning it if needed."""
+        with self.__lock:
+            try:
+                return self.__status_caches[repo_uri]
+
+            except KeyError:
+                pass
+
+        # Scan without holding the lock, an invalidate()
+        # during the scan only costs another scan
+        try:
+            status_cache = StatusCache(repo)
+
+        except GLib.Error as e:
+            debug('Failed to scan the status of "%s": %s' % (repo_uri, e))
+            return None
+
+        with self.__lock:
+            self.__status_caches[repo_uri] = status_cache
+
+        return status_cache
+
+    def set_status(self, repo_uri, path, status):
+        """Updates the status of a file in the cache, if there is one."""
+        with self.__lock:
+            status_cache = self.__status_caches.get(repo_uri)
+            if status_cache is not None:
+                status_cache[path] = status
+
+
+class GitStatusThread(WorkerThread):
+    def __init__(self, status_caches, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.__status_caches = status_caches
+
+    def push(self, repo, location, *, refresh=False,
+             priority=WorkerThread.PRIORITY_DEFAULT):
+        if repo is None:
+            debug('Invalid repository', print_stack=True)
+            return
+ 
+        git_dir = repo.get_location().get_uri()
+        if location.get_uri().startswith(git_dir):
+            debug('Invalid location: "%s" is in git dir "%s"' %
+                  (location.get_uri(), git_dir), print_stack=True)
+            return
+
+        workdir = repo.get_workdir()
+        if workdir.get_relative_path(location) is None:
+            debug('Invalid location "%s" for workdir "%s"' %
+                  (location.get_uri(), workdir.get_uri()), print_stack=True)
+            return
+
+        super().push(repo, location, refresh=refresh, priority=priority)
+
+    def task_key(self, repo, location, refresh):
+        return location.get_uri()
+
+    def merge_task(self, old_args, old_kwargs, args, kwargs):
+        # Never lose a pending refresh
+        kwargs['refresh'] = kwargs['refresh'] or old_kwargs['refresh']
+        return args, kwargs
+
+    def handle_task(self, repo, location, refresh):
+        repo_uri = repo.get_location().get_uri()
+        path = repo.get_workdir().get_relative_path(location)
+
+        # Rescanning the whole repository for
+        # a single file that changed is not worth it
+        if refresh:
+            status = repo.file_status(location)
+            self.__status_caches.set_status(repo_uri, path, status)
+
+            return location, status
+
+        status_cache = self.__status_caches.get(repo, repo_uri)
+        if status_cache is None:
+            return location, repo.file_status(location)
+
+        return location, status_cache[path]
+
+
+class GitStatusService(object):
+    """Does the status work of every window, so a file shown in several
+       windows is only statused once. Each repository has its own
+       GitStatusThread and the results are given to every listener.
+    """
+
+    def __init__(self):
+        # The threads are keyed by the repository's uri
+        self.__threads = {}
+        self.__status_caches = StatusCaches()
+        self.__listeners = weakref.WeakSet()
+
+        # The uris of the repositories each listener uses, the
+        # threads of the other repositories are stopped when idle
+        self.__repositories = weakref.WeakKeyDictionary()
+
+    def add_listener(self, listener):
+        """The listener's update_locations() is called
+           with each batch of (location, status) results.
+        """
+        self.__listeners.add(listener)
+
+    def remove_listener(self, listener):
+        self.__listeners.discard(listener)
+
+        if self.__repositories.pop(listener, None) is not None:
+            self.__stop_unused_threads()
+
+    def set_repositories(self, listener, repo_uris):
+        """Sets the uris of the repositories the listener uses."""
+        self.__repositories[listener] = set(repo_uris)
+        self.__stop_unused_threads()
+
+    def __stop_unused_threads(self):
+        used = set()
+        for repo_uris in self.__repositories.values():
+            used.update(repo_uris)
+
+        # A thread which still has work is stopped
+        # by a later call, once it is idle
+        for repo_uri, thread in list(self.__threads.items()):
+            if repo_uri not in used and thread.stop_if_idle():
+                debug('Stopped the status thread of "%s"' % (repo_uri))
+                del self.__threads[repo_uri]
+
+    def __get_thread(self, repo):
+        repo_uri = repo.get_location().get_uri()
+
+        try:
+            return self.__threads[repo_uri]
+
+        except KeyError:
+            pass
+
+        thread = GitStatusThread(self.__status_caches,
+                                 self.__deliver_results, batch=True)
+        thread.start()
+
+        self.__threads[repo_uri] = thread
+        return thread
+
+    def push(self, repo, location, **kwargs):
+        if repo is None:
+            debug('Invalid repository', print_stack=True)
+            return
+
+        self.__get_thread(repo).push(repo, location, **kwargs)
+
+    def cancel(self, uri):
+        for thread in self.__threads.values():
+            thread.cancel(uri)
+
+    def invalidate(self, repo):
+        self.__status_caches.invalidate(repo)
+
+    def terminate(self):
+        for thread in self.__threads.values():
+            thread.terminate()
+
+        self.__threads = {}
+        self.__status_caches.invalidate()
+        self.__listeners = weakref.WeakSet()
+        self.__repositories = weakref.WeakKeyDictionary()
+
+    def __deliver_results(self, results):
+        for listener in list(self.__listeners):
+            listener.update_locations(results)
+
+# ex:ts=4:et:
@@ -17,23 +17,16 @@
 #  Foundation, Inc.  51 Franklin Street, Fifth Floor, Boston, MA
 #  02110-1301 USA.
 
-from gi.repository import GLib, GObject, Gtk, Gedit, Ggit
+from gi.repository import GLib, GObject, Gtk, GtkSource, Gedit, Ggit
 
+from . import diff, metrics
 from .appactivatable import GitAppActivatable
-from .diffrenderer import DiffType, DiffRenderer
+from .blamerenderer import BlameRenderer
+from .diffrenderer import DiffRenderer, FileContext
+from .diffthread import file_context_from_hunks
 from .windowactivatable import GitWindowActivatable
 
-import sys
 import os.path
-import difflib
-
-
-class LineContext:
-    __slots__ = ('removed_lines', 'line_type')
-
-    def __init__(self):
-        self.removed_lines = []
-        self.line_type = DiffType.NONE
 
 
 class GitViewActivatable(GObject.Object, Gedit.ViewActivatable):
@@ -46,36 +39,84 @@ class GitViewActivatable(GObject.Object, Gedit.ViewActivatable):
         super().__init__()
 
         self.diff_timeout = 0
+        self.diff_generation = 0
+        self.diff_started = 0
+        self.file_contents = None
         self.file_contents_list = None
         self.file_context = None
 
+        # The edits made while a full diff is being computed
+        self.pending_edits = None
+        self.incremental_diff = None
+
+        # A windowed diff can not tell the status, it is
+        # hashed again when the buffer changed since then
+        self.status_generation = 0
+        self.status_stale = True
+
+        # The (repo, commit_id, relative_path) to blame
+        self.blame_source = None
+        self.blame_data = None
+
     def do_activate(self):
-        GitWindowActivatable.register_view_activatable(self)
+        self.window_activatable = \
+            GitWindowActivatable.register_view_activatable(self)
 
         self.app_activatable = GitAppActivatable.get_instance()
 
         self.diff_renderer = DiffRenderer()
         self.gutter = self.view.get_gutter(Gtk.TextWindowType.LEFT)
 
+        self.blame_renderer = BlameRenderer()
+        self.blame_shown = False
+        self.blame_windowed = False
+
+        self.settings_signals = []
+        if self.app_activatable.settings is not None:
+            self.settings_signals.append(
+                self.app_activatable.settings.connect('changed::show-blame',
+                                                      self.update_blame)
+            )
+
         # Note: GitWindowActivatable will call
         #       update_location() for us when needed
         self.view_signals = [
-            self.view.connect('notify::buffer', self.on_notify_buffer)
+            self.view.connect('notify::buffer', self.on_notify_buffer),
+            self.view.connect('notify::vadjustment',
+                              self.on_notify_vadjustment)
         ]
 
         self.buffer = None
         self.on_notify_buffer(self.view)
 
+        self.vadjustment = None
+        self.vadjustment_signals = []
+        self.on_notify_vadjustment(self.view)
+
     def do_deactivate(self):
         if self.diff_timeout != 0:
             GLib.source_remove(self.diff_timeout)
 
+        # Drop any diff that is still being computed
+        self.diff_generation += 1
+
         self.disconnect_buffer()
         self.buffer = None
 
         self.disconnect_view()
         self.gutter.remove(self.diff_renderer)
 
+        if self.app_activatable.settings is not None:
+            self.disconnect(self.app_activatable.settings,
+                            self.settings_signals)
+
+        self.blame_source = None
+        self.update_blame()
+
+        if self.vadjustment is not None:
+            self.disconnect(self.vadjustment, self.vadjustment_signals)
+            self.vadjustment = None
+
     def disconnect(self, obj, signals):
         for sid in signals:
             obj.disconnect(sid)
@@ -84,6 +125,7 @@ class GitViewActivatable(GObject.Object, Gedit.ViewActivatable):
 
     def disconnect_buffer(self):
         self.disconnect(self.buffer, self.buffer_signals)
+        self.disconnect(self.buffer.get_file(), self.file_signals)
 
     def disconnect_view(self):
         self.disconnect(self.view, self.view_signals)
@@ -91,76 +133,178 @@ class GitViewActivatable(GObject.Object, Gedit.ViewActivatable):
     def on_notify_buffer(self, view, gspec=None):
         if self.diff_timeout != 0:
             GLib.source_remove(self.diff_timeout)
+            self.diff_timeout = 0
 
         if self.buffer:
             self.disconnect_buffer()
 
         self.buffer = view.get_buffer()
 
-        # The changed signal is connected to in update_location().
+        # The change signals are connected to in update_location().
         # The saved signal is pointless as the window activatable
         # will see the change and call update_location().
         self.buffer_signals = [
             self.buffer.connect('loaded', self.update_location)
         ]
 
+        # Keeps the window activatable's index of the locations up
+        # to date, for example after the document is saved as
+        self.file_signals = [
+            self.buffer.get_file().connect('notify::location',
+                                           self.on_notify_location)
+        ]
+
+        self.on_notify_location()
+
         # We wait and let the loaded signal call
         # update_location() as the buffer is currently empty
 
-    # TODO: This can be called many times and by idles,
-    #       should instead do the work in another thread
+    def on_notify_vadjustment(self, view, gspec=None):
+        if self.vadjustment is not None:
+            self.disconnect(self.vadjustment, self.vadjustment_signals)
+
+        self.vadjustment = view.get_vadjustment()
+
+        if self.vadjustment is not None:
+            self.vadjustment_signals = [
+                self.vadjustment.connect('value-changed', self.on_scrolled)
+            ]
+
+    def on_scrolled(self, adjustment):
+        # Only the lines being shown are diffed for huge files
+        if self.file_contents_list is not None and self.is_windowed():
+            self.update()
+
+    def on_notify_location(self, *args):
+        if self.window_activatable is not None:
+            self.window_activatable.update_view_activatable_location(self)
+
     def update_location(self, *args):
         self.location = self.buffer.get_file().get_location()
+        self.on_notify_location()
 
         if self.location is not None:
             repo = self.app_activatable.get_repository(self.location, False)
 
         if self.location is None or repo is None:
+            # Drop any diff that is still being computed
+            self.diff_generation += 1
+
+            self.blame_source = None
+            self.update_blame()
+
             if self.file_contents_list is not None:
+                self.file_contents = None
                 self.file_contents_list = None
+                self.incremental_diff = None
+                self.pending_edits = None
                 self.gutter.remove(self.diff_renderer)
-                self.diff_renderer.set_file_context({})
-                self.buffer.disconnect(self.buffer_signals.pop())
+                self.diff_renderer.set_file_context(FileContext())
+
+                for i in range(3):
+                    self.buffer.disconnect(self.buffer_signals.pop())
 
             return
 
         if self.file_contents_list is None:
             self.gutter.insert(self.diff_renderer, 40)
-            self.buffer_signals.append(self.buffer.connect('changed',
-                                                           self.update))
+            self.buffer_signals.extend((
+                self.buffer.connect('insert-text', self.on_insert_text),
+                self.buffer.connect('delete-range', self.on_delete_range),
+                self.buffer.connect('changed', self.update)
+            ))
 
         try:
             head = repo.get_head()
-            commit = repo.lookup(head.get_target(), Ggit.Commit)
-            tree = commit.get_tree()
             relative_path = os.path.relpath(
                 os.path.realpath(self.location.get_path()),
                 repo.get_workdir().get_path()
             )
 
-            entry = tree.get_by_path(relative_path)
-            file_blob = repo.lookup(entry.get_id(), Ggit.Blob)
-            try:
-                gitconfig = repo.get_config()
-                encoding = gitconfig.get_string('gui.encoding')
-            except GLib.Error:
-                encoding = 'utf8'
-            file_contents = file_blob.get_raw_content().decode(encoding)
-            self.file_contents_list = file_contents.splitlines()
-
-            # Remove the last empty line added by gedit automatically
-            if self.file_contents_list:
-                last_item = self.file_contents_list[-1]
-                if last_item[-1:] == '\n':
-                    self.file_contents_list[-1] = last_item[:-1]
+            self.file_contents = \
+                self.app_activatable.get_file_contents(repo,
+                                                       head.get_target(),
+                                                       relative_path)
 
         except GLib.Error:
             # New file in a git repository
-            self.file_contents_list = []
+            self.file_contents = ([], None, None)
+
+        self.file_contents_list = self.file_contents[0]
+
+        if self.file_contents[1] is not None:
+            self.blame_source = (repo, head.get_target(), relative_path)
+
+        else:
+            self.blame_source = None
+
+        self.update_blame()
+
+        # The contents might have changed, the hunks are no longer
+        # valid and any diff that is being computed is out of date
+        self.diff_generation += 1
+        self.incremental_diff = None
+        self.pending_edits = None
+        self.status_stale = True
 
         self.update()
 
+    def update_blame(self, *args):
+        if self.blame_data is not None:
+            self.blame_data.listeners.discard(self)
+            self.blame_data = None
+
+        if self.blame_source is None or self.blame_windowed or \
+                not self.app_activatable.get_show_blame():
+            if self.blame_shown:
+                self.gutter.remove(self.blame_renderer)
+                self.blame_shown = False
+
+            return
+
+        if not self.blame_shown:
+            self.gutter.insert(self.blame_renderer, 30)
+            self.blame_shown = True
+
+        # The shown lines are blamed first
+        repo, commit_id, relative_path = self.blame_source
+        self.blame_data = \
+            self.app_activatable.get_blame(repo, commit_id, relative_path,
+                                           len(self.file_contents_list),
+                                           self.get_visible_lines()[0])
+
+        self.blame_data.listeners.add(self)
+        self.on_blame_updated(self.blame_data)
+
+    def on_blame_updated(self, blame_data):
+        if blame_data is self.blame_data:
+            self.blame_renderer.set_file_context(blame_data.file_context)
+
+    def on_insert_text(self, buf, location, text, length):
+        line = location.get_line()
+        count = len(diff.split_lines(text)) - 1
+
+        self.add_edit(diff.IncrementalDiff.lines_inserted, line, count)
+
+    def on_delete_range(self, buf, start, end):
+        self.add_edit(diff.IncrementalDiff.lines_deleted,
+                      start.get_line(), end.get_line())
+
+    def add_edit(self, edit, *args):
+        self.status_stale = True
+
+        if self.incremental_diff is not None:
+            edit(self.incremental_diff, *args)
+
+        # Replayed once the full diff has finished
+        if self.pending_edits is not None:
+            self.pending_edits.append((edit, args))
+
     def update(self, *unused):
+        # The edits will be replayed once the full diff has finished
+        if self.pending_edits is not None:
+            return
+
         # We don't let the delay accumulate
         if self.diff_timeout != 0:
             return
@@ -168,98 +312,217 @@ class GitViewActivatable(GObject.Object, Gedit.ViewActivatable):
         # Do the initial diff without a delay
         if self.file_context is None:
             self.on_diff_timeout()
+            return
+
+        # Only the edited or shown lines need to be diffed, so
+        # the delay does not have to depend on the size of the buffer
+        if self.incremental_diff is not None or self.is_windowed():
+            delay = 50
 
         else:
             n_lines = self.buffer.get_line_count()
             delay = min(10000, 200 * (n_lines // 2000 + 1))
 
-            self.diff_timeout = GLib.timeout_add(delay,
-                                                 self.on_diff_timeout)
+        self.diff_timeout = GLib.timeout_add(delay, self.on_diff_timeout)
 
     def on_diff_timeout(self):
         self.diff_timeout = 0
 
-        # Must be a new file
+        n_lines = self.buffer.get_line_count()
+
+        # A new file's context only depends on the number of lines
         if not self.file_contents_list:
             self.status = Ggit.StatusFlags.WORKING_TREE_NEW
 
-            n_lines = self.buffer.get_line_count()
-            if len(self.diff_renderer.file_context) == n_lines:
-                return False
+            if len(self.diff_renderer.file_context) != n_lines:
+                hunks = [(0, 0, 0, n_lines)]
+                self.set_file_context(file_context_from_hunks([], hunks))
+
+            return False
+
+        if self.is_windowed():
+            self.incremental_diff = None
+
+            started = metrics.now()
+
+            start, end = self.get_visible_lines()
+            hunks = diff.diff_window(self.file_contents_list,
+                                     self.get_lines(start, end), start)
+            self.set_hunks(hunks, windowed=True)
+
+            # Only a changed window tells the status
+            if hunks:
+                self.status = Ggit.StatusFlags.WORKING_TREE_MODIFIED
 
-            line_context = LineContext()
-            line_context.line_type = DiffType.ADDED
-            file_context = dict(zip(range(1, n_lines + 1),
-                                    [line_context] * n_lines))
+            elif self.status_stale:
+                self.update_status()
 
-            self.diff_renderer.set_file_context(file_context)
+            metrics.record_duration('diff.window', started)
             return False
 
+        if self.incremental_diff is not None:
+            window = self.incremental_diff.window(n_lines)
+
+            if window is not None:
+                started = metrics.now()
+
+                self.incremental_diff.rediff(window,
+                                             self.get_lines(*window[4:]))
+                self.set_hunks(self.incremental_diff.hunks)
+
+                metrics.record_duration('diff.incremental.lines' +
+                                        metrics.size_bucket(n_lines),
+                                        started)
+                return False
+
+            # The edits were too big, instead do a full diff
+            if self.incremental_diff.dirty is None:
+                return False
+
+            self.incremental_diff = None
+
+        # Only take a snapshot here, the diff itself
+        # is done by the app activatable's diff thread
         start_iter, end_iter = self.buffer.get_bounds()
         src_contents = start_iter.get_visible_text(end_iter)
-        src_contents_list = src_contents.splitlines()
 
-        # GtkTextBuffer does not consider a trailing "\n" to be text
-        if len(src_contents_list) != self.buffer.get_line_count():
-            src_contents_list.append('')
+        self.diff_generation += 1
+        self.diff_started = metrics.now()
+        self.pending_edits = []
 
-        diff = difflib.unified_diff(self.file_contents_list,
-                                    src_contents_list, n=0)
+        self.app_activatable.diff_thread.push(self, self.diff_generation,
+                                              self.file_contents,
+                                              src_contents,
+                                              self.get_trailing_newline())
+        return False
 
-        # Skip the first 2 lines: ---, +++
-        try:
-            next(diff)
-            next(diff)
+    def update_status(self):
+        # Hashed by the diff thread, as for a full diff
+        start_iter, end_iter = self.buffer.get_bounds()
+        src_contents = start_iter.get_visible_text(end_iter)
 
-        except StopIteration:
-            # Nothing has changed
-            self.status = Ggit.StatusFlags.CURRENT
+        self.status_stale = False
+        self.status_generation += 1
+
+        self.app_activatable.diff_thread.push(self, self.status_generation,
+                                              self.file_contents,
+                                              src_contents,
+                                              self.get_trailing_newline(),
+                                              status_only=True)
+
+    def on_status_finished(self, generation, status):
+        # The buffer has been hashed again since
+        if generation == self.status_generation:
+            self.status = status
+
+    def get_trailing_newline(self):
+        # The newline gedit adds when saving, needed
+        # to hash the buffer the same way as the blob
+        if not self.buffer.get_implicit_trailing_newline():
+            return ''
+
+        newline_type = self.buffer.get_file().get_newline_type()
+
+        if newline_type == GtkSource.NewlineType.CR:
+            return '\r'
+
+        elif newline_type == GtkSource.NewlineType.CR_LF:
+            return '\r\n'
+
+        return '\n'
+
+    def is_windowed(self):
+        """Whether the file is too big to be diffed as a whole."""
+        return isinstance(self.file_contents_list, diff.BlobLines) or \
+            self.buffer.get_char_count() > diff.MAX_DIFF_SIZE
+
+    def get_visible_lines(self):
+        """Returns the shown lines and a page above and below them."""
+        rect = self.view.get_visible_rect()
+
+        start_iter = self.view.get_line_at_y(rect.y)[0]
+        end_iter = self.view.get_line_at_y(rect.y + rect.height)[0]
+
+        start = start_iter.get_line()
+        end = end_iter.get_line() + 1
+        page = end - start
+
+        return max(start - page, 0), \
+            min(end + page, self.buffer.get_line_count())
+
+    def get_lines(self, start, end):
+        if start == end:
+            return []
+
+        start_iter = self.buffer.get_iter_at_line(start)
+
+        if end < self.buffer.get_line_count():
+            end_iter = self.buffer.get_iter_at_line(end)
 
         else:
-            self.status = Ggit.StatusFlags.WORKING_TREE_MODIFIED
+            end_iter = self.buffer.get_end_iter()
 
-        file_context = {}
-        for line_data in diff:
-            if line_data[0] == '@':
-                for token in line_data.split():
-                    if token[0] == '+':
-                        hunk_point = int(token.split(',', 1)[0])
-                        line_context = LineContext()
-                        break
+        lines = diff.split_lines(start_iter.get_visible_text(end_iter))
 
-            elif line_data[0] == '-':
-                if line_context.line_type == DiffType.NONE:
-                    line_context.line_type = DiffType.REMOVED
+        # Ignore the line terminator of the last line
+        return lines[:end - start]
 
-                line_context.removed_lines.append(line_data[1:])
+    def on_diff_finished(self, generation, hunks, file_context):
+        # Another full diff has been started since the snapshot was taken
+        if generation != self.diff_generation:
+            return
+
+        # From the snapshot to the result, including the time queued
+        n_lines = self.buffer.get_line_count()
+        metrics.record_duration('diff.full.lines' +
+                                metrics.size_bucket(n_lines),
+                                self.diff_started)
 
-                # No hunk point increase
-                file_context[hunk_point] = line_context
+        pending_edits = self.pending_edits
+        self.pending_edits = None
 
-            elif line_data[0] == '+':
-                if line_context.line_type == DiffType.NONE:
-                    line_context.line_type = DiffType.ADDED
-                    file_context[hunk_point] = line_context
+        # Bring the hunks up to date with the edits made since the
+        # snapshot, the next timeout will then only diff those lines
+        self.incremental_diff = diff.IncrementalDiff(self.file_contents_list,
+                                                     hunks)
 
-                elif line_context.line_type == DiffType.REMOVED:
-                    # Why is this the only one that does
-                    # not add it to file_context?
+        for edit, args in pending_edits:
+            edit(self.incremental_diff, *args)
 
-                    line_context.line_type = DiffType.MODIFIED
+        if self.incremental_diff.dirty is None:
+            self.set_hunks(hunks, file_context)
 
-                else:
-                    file_context[hunk_point] = line_context
+        else:
+            self.update()
 
-                hunk_point += 1
+    def set_hunks(self, hunks, file_context=None, windowed=False):
+        if file_context is None:
+            file_context = file_context_from_hunks(self.file_contents_list,
+                                                   hunks)
 
-        # Occurs when all of the original content is deleted
-        if 0 in file_context:
-            for i in reversed(list(file_context.keys())):
-                file_context[i + 1] = file_context[i]
-                del file_context[i]
+        # Not for a windowed diff, which does not cover the whole file
+        if not windowed:
+            if hunks:
+                self.status = Ggit.StatusFlags.WORKING_TREE_MODIFIED
 
+            else:
+                self.status = Ggit.StatusFlags.CURRENT
+
+        # The blame is of HEAD's lines, the hunks map the buffer's
+        # lines to them which keeps the blame valid while editing.
+        # A windowed diff does not map the lines outside of the
+        # window, so the blame is only shown with a full diff.
+        if windowed != self.blame_windowed:
+            self.blame_windowed = windowed
+            self.update_blame()
+
+        if not windowed:
+            self.blame_renderer.set_hunks(hunks)
+
+        self.set_file_context(file_context)
+
+    def set_file_context(self, file_context):
         self.file_context = file_context
         self.diff_renderer.set_file_context(file_context)
-        return False
 
 # ex:ts=4:et:
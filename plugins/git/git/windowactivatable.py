@@ -19,7 +19,9 @@
 
 from gi.repository import GLib, GObject, Gio, Gedit, Ggit
 
+import collections
 import collections.abc
+import os
 import weakref
 
 from .appactivatable import GitAppActivatable
@@ -28,12 +30,15 @@ from .workerthread import WorkerThread
 
 
 class FileNode(object):
-    __slots__ = ('id', 'name')
+    __slots__ = ('id', 'name', 'markup')
 
     def __init__(self, msg):
         self.id = msg.id
         self.name = msg.name
 
+        # The markup we last set
+        self.markup = None
+
 
 class FileNodes(collections.abc.MutableMapping):
     __slots__ = ('__data')
@@ -79,30 +84,6 @@ class FileNodes(collections.abc.MutableMapping):
         return len(self.__data)
 
 
-class GitStatusThread(WorkerThread):
-    def push(self, repo, location):
-        if repo is None:
-            debug('Invalid repository', print_stack=True)
-            return
- 
-        git_dir = repo.get_location().get_uri()
-        if location.get_uri().startswith(git_dir):
-            debug('Invalid location: "%s" is in git dir "%s"' %
-                  (location.get_uri(), git_dir), print_stack=True)
-            return
-
-        workdir = repo.get_workdir()
-        if workdir.get_relative_path(location) is None:
-            debug('Invalid location "%s" for workdir "%s"' %
-                  (location.get_uri(), workdir.get_uri()), print_stack=True)
-            return
-
-        super().push(repo, location)
-
-    def handle_task(self, repo, location):
-        return location, repo.file_status(location)
-
-
 class GitWindowActivatable(GObject.Object, Gedit.WindowActivatable):
     window = GObject.Property(type=Gedit.Window)
 
@@ -113,6 +94,12 @@ class GitWindowActivatable(GObject.Object, Gedit.WindowActivatable):
 
         self.view_activatables = weakref.WeakSet()
 
+        # Avoid having to search the view activatables, the
+        # location index is kept up to date by the view activatables
+        self.view_activatables_by_view = weakref.WeakValueDictionary()
+        self.view_activatables_by_uri = {}
+        self.view_activatable_uris = weakref.WeakKeyDictionary()
+
     @classmethod
     def register_view_activatable(cls, view_activatable):
         window = view_activatable.view.get_toplevel()
@@ -123,6 +110,10 @@ class GitWindowActivatable(GObject.Object, Gedit.WindowActivatable):
         window_activatable = cls.windows[window]
 
         window_activatable.view_activatables.add(view_activatable)
+        window_activatable.view_activatables_by_view[view_activatable.view] = \
+            view_activatable
+        window_activatable.update_view_activatable_location(view_activatable)
+
         view_activatable.connect('notify::status',
                                  window_activatable.notify_status)
 
@@ -136,13 +127,19 @@ class GitWindowActivatable(GObject.Object, Gedit.WindowActivatable):
 
         self.bus = self.window.get_message_bus()
 
-        self.git_status_thread = GitStatusThread(self.update_location)
-        self.git_status_thread.start()
+        # Shared with the other windows
+        self.status_service = self.app_activatable.status_service
+        self.status_service.add_listener(self)
 
         self.file_nodes = FileNodes()
         self.monitors = {}
         self.has_focus = True
 
+        # Used to only refresh what changed while we did not have focus
+        self.repository_stamps = {}
+        self.file_stamps = {}
+        self.changed_locations = set()
+
         self.gobject_signals = {
             self.window: [
                 self.window.connect('tab-removed', self.tab_removed),
@@ -172,7 +169,8 @@ class GitWindowActivatable(GObject.Object, Gedit.WindowActivatable):
 
     def do_deactivate(self):
         self.clear_monitors()
-        self.git_status_thread.terminate()
+        self.status_service.remove_listener(self)
+        self.cancel_statuses()
 
         for gobject, sids in self.gobject_signals.items():
             for sid in sids:
@@ -192,25 +190,59 @@ class GitWindowActivatable(GObject.Object, Gedit.WindowActivatable):
         if self.bus.is_registered('/plugins/filebrowser', 'refresh'):
             self.bus.send('/plugins/filebrowser', 'refresh')
 
-    def get_view_activatable_by_view(self, view):
-        for view_activatable in self.view_activatables:
-            if view_activatable.view == view:
-                return view_activatable
+    def update_view_activatable_location(self, view_activatable):
+        """Must be called when the view activatable's location changes."""
+        buf = view_activatable.view.get_buffer()
+        location = buf.get_file().get_location() if buf is not None else None
+        uri = location.get_uri() if location is not None else None
 
-        return None
+        old_uri = self.view_activatable_uris.get(view_activatable)
+        if old_uri == uri:
+            return
 
-    def get_view_activatable_by_location(self, location):
-        for view_activatable in self.view_activatables:
-            buf = view_activatable.view.get_buffer()
-            if buf is None:
-                continue
+        self.__unindex_location(view_activatable, old_uri)
 
-            view_location = buf.get_file().get_location()
-            if view_location is None:
-                continue
+        if uri is not None:
+            try:
+                view_activatables = self.view_activatables_by_uri[uri]
+
+            except KeyError:
+                view_activatables = weakref.WeakSet()
+                self.view_activatables_by_uri[uri] = view_activatables
+
+            view_activatables.add(view_activatable)
 
-            if view_location.equal(location):
-                return view_activatable
+        self.view_activatable_uris[view_activatable] = uri
+
+    def __unindex_location(self, view_activatable, uri):
+        if uri is None:
+            return
+
+        view_activatables = self.view_activatables_by_uri.get(uri)
+        if view_activatables is None:
+            return
+
+        view_activatables.discard(view_activatable)
+        if len(view_activatables) == 0:
+            del self.view_activatables_by_uri[uri]
+
+    def remove_view_activatable(self, view_activatable):
+        self.view_activatables.discard(view_activatable)
+        self.view_activatables_by_view.pop(view_activatable.view, None)
+
+        uri = self.view_activatable_uris.pop(view_activatable, None)
+        self.__unindex_location(view_activatable, uri)
+
+    def get_view_activatable_by_view(self, view):
+        return self.view_activatables_by_view.get(view)
+
+    def get_view_activatable_by_location(self, location):
+        uri = location.get_uri()
+        view_activatables = self.view_activatables_by_uri.get(uri)
+
+        # Any of the views will do, they all have the same status
+        for view_activatable in view_activatables or ():
+            return view_activatable
 
         return None
 
@@ -224,7 +256,8 @@ class GitWindowActivatable(GObject.Object, Gedit.WindowActivatable):
 
         repo = self.get_repository(location)
         if repo is not None:
-            self.git_status_thread.push(repo, location)
+            self.status_service.push(repo, location,
+                                     priority=self.get_priority(location))
 
     def tab_removed(self, window, tab):
         view = tab.get_view()
@@ -233,7 +266,8 @@ class GitWindowActivatable(GObject.Object, Gedit.WindowActivatable):
         # might use the view's status and not the file's actual status
         view_activatable = self.get_view_activatable_by_view(view)
         if view_activatable is not None:
-            self.view_activatables.remove(view_activatable)
+            self.remove_view_activatable(view_activatable)
+            self.update_repositories()
 
         location = view.get_buffer().get_file().get_location()
         if location is None:
@@ -244,47 +278,152 @@ class GitWindowActivatable(GObject.Object, Gedit.WindowActivatable):
 
         repo = self.get_repository(location)
         if repo is not None:
-            self.git_status_thread.push(repo, location)
+            self.status_service.push(repo, location)
+
+    def get_priority(self, location, priority=WorkerThread.PRIORITY_DEFAULT):
+        # The active document's status is the most visible
+        document = self.window.get_active_document()
+        if document is not None:
+            active_location = document.get_file().get_location()
+
+            if active_location is not None and \
+                    active_location.equal(location):
+                return WorkerThread.PRIORITY_HIGH
+
+        return priority
+
+    def get_file_stamp(self, location):
+        path = location.get_path()
+        if path is None:
+            return None
+
+        try:
+            return os.stat(path).st_mtime_ns
+
+        except OSError:
+            return None
+
+    def get_view_locations(self):
+        for view_activatable in self.view_activatables:
+            buf = view_activatable.view.get_buffer()
+
+            location = buf.get_file().get_location()
+            if location is not None:
+                yield view_activatable, location
 
     def focus_in_event(self, window, event):
         # Enables the file monitors so they can cause things
-        # to update again. We disabled them when the focus
-        # was lost and we will instead do a full update now.
+        # to update again. We only kept track of what they
+        # saw while we did not have focus and will now
+        # only update what has actually changed.
         self.has_focus = True
 
-        self.app_activatable.clear_repositories()
+        self.app_activatable.clear_missing_repositories()
 
-        for view_activatable in self.view_activatables:
-            # Must reload the location's contents, not just rediff
-            GLib.idle_add(view_activatable.update_location)
+        repository_stamps = {}
+        changed_repositories = set()
+
+        def repository_changed(repo):
+            repo_uri = repo.get_location().get_uri()
+
+            if repo_uri not in repository_stamps:
+                stamp = self.app_activatable.get_repository_stamp(repo)
+                repository_stamps[repo_uri] = stamp
+
+                if self.repository_stamps.get(repo_uri) != stamp:
+                    changed_repositories.add(repo_uri)
+                    self.status_service.invalidate(repo)
+
+            return repo_uri in changed_repositories
+
+        changed_locations = self.changed_locations
+        self.changed_locations = set()
+
+        # A changed .gitignore can change the status of any file
+        for uri in changed_locations:
+            if uri.endswith('/.gitignore'):
+                repo = self.get_repository(Gio.File.new_for_uri(uri))
+                if repo is not None:
+                    repo_uri = repo.get_location().get_uri()
+                    self.repository_stamps.pop(repo_uri, None)
+
+        file_stamps = {}
+        for view_activatable, location in self.get_view_locations():
+            uri = location.get_uri()
+
+            # In case the file's directory is not being monitored
+            file_stamps[uri] = self.get_file_stamp(location)
+            if self.file_stamps.get(uri) != file_stamps[uri]:
+                changed_locations.add(uri)
+
+            # The diff is against the buffer, so only
+            # a change to the repository matters here
+            repo = self.get_repository(location)
+            if repo is not None and repository_changed(repo):
+                # Must reload the location's contents, not just rediff
+                GLib.idle_add(view_activatable.update_location)
 
         for location in self.file_nodes:
-            # Still need to update the git status
-            # as the file could now be in .gitignore
+            repo = self.get_repository(location)
+            if repo is None:
+                continue
+
+            priority = self.get_priority(location,
+                                         WorkerThread.PRIORITY_LOW)
+
+            if repository_changed(repo):
+                self.status_service.push(repo, location,
+                                         priority=priority)
+
+            elif location.get_uri() in changed_locations:
+                # Still need to update the git status
+                # as the file could now be in .gitignore
+                self.status_service.push(repo, location, refresh=True,
+                                         priority=priority)
+
+        # Forget about the files and repositories which are no longer used
+        self.file_stamps = file_stamps
+        self.repository_stamps = repository_stamps
+        self.status_service.set_repositories(self, repository_stamps)
+
+    def update_repositories(self):
+        # Lets the status service stop the threads of
+        # the repositories which are no longer used
+        repo_uris = set()
+
+        locations = list(self.file_nodes)
+        for unused, location in self.get_view_locations():
+            locations.append(location)
+
+        for location in locations:
             repo = self.get_repository(location)
             if repo is not None:
-                self.git_status_thread.push(repo, location)
+                repo_uris.add(repo.get_location().get_uri())
+
+        self.status_service.set_repositories(self, repo_uris)
 
     def focus_out_event(self, window, event):
-        # Disables the file monitors so they don't
-        # cause anything to update. We will do a
-        # full update when we have focus again.
+        # The file monitors only record what changed
+        # while we don't have focus. We will update
+        # only what changed when we have focus again.
         self.has_focus = False
 
     def unregistered(self, bus, object_path, method):
         # Avoid warnings like crazy if the file browser becomes disabled
         if object_path == '/plugins/filebrowser' and method == 'root_changed':
             self.clear_monitors()
-            self.git_status_thread.clear()
+            self.cancel_statuses()
             self.file_nodes = FileNodes()
+            self.update_repositories()
 
     def get_repository(self, location, is_dir=False):
         return self.app_activatable.get_repository(location, is_dir)
 
     def root_changed(self, bus, msg, data=None):
         self.clear_monitors()
-        self.git_status_thread.clear()
+        self.cancel_statuses()
         self.file_nodes = FileNodes()
+        self.update_repositories()
 
         location = msg.location
 
@@ -295,6 +434,9 @@ class GitWindowActivatable(GObject.Object, Gedit.WindowActivatable):
     def inserted(self, bus, msg, data=None):
         location = msg.location
 
+        if location.get_basename() == '.git':
+            self.app_activatable.invalidate_repositories(location.get_parent())
+
         repo = self.get_repository(location, msg.is_directory)
         if repo is None:
             return
@@ -304,16 +446,28 @@ class GitWindowActivatable(GObject.Object, Gedit.WindowActivatable):
 
         else:
             self.file_nodes[location] = FileNode(msg)
-            self.git_status_thread.push(repo, location)
+            self.status_service.push(repo, location)
 
     def deleted(self, bus, msg, data=None):
         location = msg.location
         uri = location.get_uri()
 
+        if location.get_basename() == '.git':
+            self.app_activatable.invalidate_repositories(location.get_parent())
+
         if uri in self.monitors:
             self.monitors[uri].cancel()
             del self.monitors[uri]
 
+            # Don't bother with the files that were in the directory
+            prefix = uri + '/'
+            for node_location in list(self.file_nodes):
+                node_uri = node_location.get_uri()
+
+                if node_uri.startswith(prefix):
+                    del self.file_nodes[node_location]
+                    self.cancel_status(node_location)
+
         else:
             try:
                 del self.file_nodes[location]
@@ -321,9 +475,31 @@ class GitWindowActivatable(GObject.Object, Gedit.WindowActivatable):
             except KeyError:
                 pass
 
-    def update_location(self, result):
-        location, status = result
+            self.cancel_status(location)
 
+    def cancel_status(self, location):
+        """Cancels the location's status, unless another window needs it."""
+        for window_activatable in self.windows.values():
+            if window_activatable is not self and \
+                    location in window_activatable.file_nodes:
+                return
+
+        self.status_service.cancel(location.get_uri())
+
+    def cancel_statuses(self):
+        for location in self.file_nodes:
+            self.cancel_status(location)
+
+    def update_locations(self, results):
+        # Only the newest status of a location matters
+        statuses = collections.OrderedDict()
+        for location, status in results:
+            statuses[location.get_uri()] = (location, status)
+
+        for location, status in statuses.values():
+            self.update_location(location, status)
+
+    def update_location(self, location, status):
         # The node may have been deleted
         # before the status was determined
         try:
@@ -350,6 +526,11 @@ class GitWindowActivatable(GObject.Object, Gedit.WindowActivatable):
                     status & Ggit.StatusFlags.WORKING_TREE_DELETED:
                 markup = '<span strikethrough="true">%s</span>' % (markup)
 
+        # Most of the statuses are unchanged after a refresh
+        if markup == file_node.markup:
+            return
+
+        file_node.markup = markup
         self.bus.send_sync('/plugins/filebrowser', 'set_markup',
                            id=file_node.id, markup=markup)
 
@@ -372,9 +553,8 @@ class GitWindowActivatable(GObject.Object, Gedit.WindowActivatable):
         monitor.connect('changed', self.monitor_changed)
 
     def monitor_changed(self, monitor, file_a, file_b, event_type):
-        # Don't update anything as we will do
-        # a full update when we have focus again
-        if not self.has_focus:
+        if event_type == Gio.FileMonitorEvent.CREATED:
+            self.file_created(file_a)
             return
 
         # Only monitor for changes as the file browser
@@ -382,6 +562,15 @@ class GitWindowActivatable(GObject.Object, Gedit.WindowActivatable):
         if event_type != Gio.FileMonitorEvent.CHANGED:
             return
 
+        # Don't update anything as we will update
+        # these files when we have focus again
+        if not self.has_focus:
+            for f in (file_a, file_b):
+                if f is not None:
+                    self.changed_locations.add(f.get_uri())
+
+            return
+
         for f in (file_a, file_b):
             if f is None:
                 continue
@@ -399,6 +588,26 @@ class GitWindowActivatable(GObject.Object, Gedit.WindowActivatable):
             if f in self.file_nodes:
                 repo = self.get_repository(f)
                 if repo is not None:
-                    self.git_status_thread.push(repo, f)
+                    self.status_service.push(repo, f, refresh=True,
+                                             priority=self.get_priority(f))
+
+    def file_created(self, location):
+        # The file browser inserts the new file, but the repository's
+        # status scan could be from before it existed and list it as
+        # unchanged. The file is refreshed when we have focus again.
+        if not self.has_focus:
+            self.changed_locations.add(location.get_uri())
+            return
+
+        repo = self.get_repository(location)
+        if repo is None:
+            return
+
+        # In case the file browser inserts it after this
+        self.status_service.invalidate(repo)
+
+        if location in self.file_nodes:
+            self.status_service.push(repo, location, refresh=True,
+                                     priority=self.get_priority(location))
 
 # ex:ts=4:et:
@@ -21,43 +21,130 @@ from gi.repository import GLib
 
 import abc
 import collections
-import queue
+import heapq
+import itertools
 import threading
 import traceback
 
+from . import metrics
 from .debug import debug
 
 
+class _Task(object):
+    __slots__ = ('key', 'args', 'kwargs', 'priority', 'cancelled', 'queued')
+
+    def __init__(self, key, args, kwargs, priority):
+        self.key = key
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.cancelled = False
+        self.queued = metrics.now()
+
+
 class WorkerThread(threading.Thread):
     __metaclass__ = abc.ABCMeta
 
-    __sentinel = object()
+    # Tasks with a lower priority value are handled first
+    PRIORITY_HIGH = -100
+    PRIORITY_DEFAULT = 0
+    PRIORITY_LOW = 100
 
-    def __init__(self, callback, chunk_size=1, *args, **kwargs):
+    # The number of results delivered between checks of the budget
+    BATCH_SIZE = 32
+
+    def __init__(self, callback, *args, budget=5, batch=False, **kwargs):
+        """The callback is called in the main loop with each result,
+           or with a list of results if batch is True. Each iteration
+           of the main loop spends at most budget milliseconds on it.
+        """
         super().__init__(*args, **kwargs)
 
         self.__callback = callback
-        self.__chunk_size = chunk_size
+        self.__budget = budget * 1000
+        self.__batch = batch
 
-        self.__quit = threading.Event()
+        self.__quit = False
         self.__has_idle = threading.Event()
 
-        self.__tasks = queue.Queue()
+        # Whether a task is being handled
+        self.__busy = False
+
+        # The pending tasks are a heap of (priority, sequence, task)
+        # and the tasks that have a key are also kept in __pending
+        # so pushing the same task again can be coalesced
+        self.__lock = threading.Condition()
+        self.__tasks = []
+        self.__pending = {}
+        self.__sequence = itertools.count()
+
+        # Incremented by clear() to drop the
+        # result of the task being handled
+        self.__generation = 0
+
         self.__results = collections.deque()
 
+        # The names of the metrics recorded for this thread
+        name = type(self).__name__
+        self.__queue_latency_metric = name + '.queue_latency'
+        self.__queue_depth_metric = name + '.queue_depth'
+        self.__task_duration_metric = name + '.task_duration'
+        self.__idle_batch_metric = name + '.idle_batch_size'
+
     @abc.abstractmethod
     def handle_task(self, *args, **kwargs):
         raise NotImplementedError
 
+    def task_key(self, *args, **kwargs):
+        """Returns the key used to coalesce pending tasks,
+           tasks with a key of None are never coalesced.
+        """
+        return None
+
+    def merge_task(self, old_args, old_kwargs, args, kwargs):
+        """Called when a task is pushed while a task with the
+           same key is pending, by default the newer task wins.
+        """
+        return args, kwargs
+
     # TODO: add, put, push?
-    def push(self, *args, **kwargs):
-        self.__tasks.put((args, kwargs))
+    def push(self, *args, priority=PRIORITY_DEFAULT, **kwargs):
+        key = self.task_key(*args, **kwargs)
 
-    def __close(self, process_results):
-        self.__quit.set()
+        with self.__lock:
+            task = self.__pending.get(key) if key is not None else None
+
+            if task is not None:
+                task.args, task.kwargs = self.merge_task(task.args,
+                                                         task.kwargs,
+                                                         args, kwargs)
 
-        # Prevent the queue.get() from blocking forever
-        self.__tasks.put(self.__sentinel)
+                if task.priority <= priority:
+                    return
+
+                # Requeue it with the higher priority
+                task.cancelled = True
+                args, kwargs = task.args, task.kwargs
+
+            task = _Task(key, args, kwargs, priority)
+            if key is not None:
+                self.__pending[key] = task
+
+            heapq.heappush(self.__tasks,
+                           (priority, next(self.__sequence), task))
+            self.__lock.notify()
+
+    def cancel(self, key):
+        """Cancels the pending task with the key, if any."""
+        with self.__lock:
+            task = self.__pending.pop(key, None)
+            if task is not None:
+                task.cancelled = True
+
+    def __close(self, process_results):
+        with self.__lock:
+            self.__quit = True
+            self.__lock.notify()
 
         super().join()
 
@@ -71,47 +158,82 @@ class WorkerThread(threading.Thread):
     def terminate(self):
         self.__close(False)
 
+    def stop_if_idle(self):
+        """Stops the thread, without waiting for it, if it has no
+           task to handle. Returns whether the thread was stopped.
+        """
+        with self.__lock:
+            if self.__busy or \
+                    any(not task.cancelled for unused, unused, task
+                        in self.__tasks):
+                return False
+
+            self.__quit = True
+            self.__lock.notify()
+
+        return True
+
     def join(self):
         self.__close(True)
 
     def clear(self):
-        old_tasks = self.__tasks
-        self.__tasks = queue.Queue(1)
+        with self.__lock:
+            self.__tasks = []
+            self.__pending = {}
+            self.__generation += 1
+
+            # The result of the task being handled is
+            # dropped as the generation no longer matches
+            self.__results.clear()
 
-        # Prevent the queue.get() from blocking forever
-        old_tasks.put(self.__sentinel)
+    def __next_task(self):
+        with self.__lock:
+            self.__busy = False
 
-        # Block until the old queue has finished, otherwise
-        # a old result could be added to the new results queue
-        self.__tasks.put(self.__sentinel)
-        self.__tasks.put(self.__sentinel)
+            while True:
+                while not self.__tasks and not self.__quit:
+                    self.__lock.wait()
 
-        old_tasks = self.__tasks
-        self.__tasks = queue.Queue()
+                if self.__quit:
+                    return None, None
 
-        # Switch to the new queue
-        old_tasks.put(self.__sentinel)
+                priority, sequence, task = heapq.heappop(self.__tasks)
+                if task.cancelled:
+                    continue
 
-        # Finally, we can now create a new deque without
-        # the possibility of any old results being added to it
-        self.__results.clear()
+                if task.key is not None:
+                    del self.__pending[task.key]
+
+                metrics.record(self.__queue_depth_metric, len(self.__tasks))
+                metrics.record_duration(self.__queue_latency_metric,
+                                        task.queued)
+
+                self.__busy = True
+                return task, self.__generation
 
     def run(self):
-        while not self.__quit.is_set():
-            task = self.__tasks.get()
-            if task is self.__sentinel:
-                continue
+        while True:
+            task, generation = self.__next_task()
+            if task is None:
+                break
 
-            args, kwargs = task
+            start = metrics.now()
 
             try:
-                result = self.handle_task(*args, **kwargs)
+                result = self.handle_task(*task.args, **task.kwargs)
 
             except Exception:
                 traceback.print_exc()
                 continue
 
-            self.__results.append(result)
+            finally:
+                metrics.record_duration(self.__task_duration_metric, start)
+
+            with self.__lock:
+                if generation != self.__generation:
+                    continue
+
+                self.__results.append(result)
 
             # Avoid having an idle for every result
             if not self.__has_idle.is_set():
@@ -123,28 +245,61 @@ class WorkerThread(threading.Thread):
                                            '[gedit] git %s result callback idle' %
                                            (type(self).__name__,))
 
+    def __deliver(self, results):
+        if self.__batch:
+            try:
+                self.__callback(results)
+
+            except Exception:
+                traceback.print_exc()
+
+            return
+
+        for result in results:
+            try:
+                self.__callback(result)
+
+            except Exception:
+                traceback.print_exc()
+
     def __in_idle(self):
-        try:
-            for i in range(self.__chunk_size):
-                result = self.__results.popleft()
+        # Deliver as many results as the budget allows, otherwise
+        # thousands of results would take thousands of iterations
+        deadline = GLib.get_monotonic_time() + self.__budget
+        n_delivered = 0
 
-                try:
-                    self.__callback(result)
+        while True:
+            results = []
 
-                except Exception:
-                    traceback.print_exc()
+            try:
+                # Only check the time after each batch
+                for i in range(self.BATCH_SIZE):
+                    results.append(self.__results.popleft())
 
-        except IndexError:
-            # Must be cleared before we check the results length
-            self.__has_idle.clear()
+            except IndexError:
+                pass
 
-            # Only remove the idle when there are no more items,
-            # some could have been added after the IndexError was raised
-            if len(self.__results) == 0:
-                debug('%s<%s>: result callback idle finished' %
-                      (type(self).__name__, self.name))
-                return GLib.SOURCE_REMOVE
+            if results:
+                self.__deliver(results)
+                n_delivered += len(results)
+
+            if len(results) < self.BATCH_SIZE:
+                metrics.record(self.__idle_batch_metric, n_delivered)
+
+                # Must be cleared before we check the results length
+                self.__has_idle.clear()
+
+                # Only remove the idle when there are no more items,
+                # some could have been added after the IndexError was raised
+                if len(self.__results) == 0:
+                    debug('%s<%s>: result callback idle finished' %
+                          (type(self).__name__, self.name))
+                    return GLib.SOURCE_REMOVE
+
+                return GLib.SOURCE_CONTINUE
 
-        return GLib.SOURCE_CONTINUE
+            if GLib.get_monotonic_time() >= deadline:
+                metrics.record(self.__idle_batch_metric, n_delivered)
+                return GLib.SOURCE_CONTINUE
 
 # ex:ts=4:et:
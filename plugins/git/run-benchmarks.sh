@@ -0,0 +1,6 @@
+#!/bin/bash
+# The Gedit typelib and library are private to gedit
+GEDIT_LIBDIR=${GEDIT_LIBDIR:-$(pkg-config --variable=libdir gedit)/gedit}
+export GI_TYPELIB_PATH=$GEDIT_LIBDIR/girepository-1.0:$GI_TYPELIB_PATH
+export LD_LIBRARY_PATH=$GEDIT_LIBDIR:$LD_LIBRARY_PATH
+python3 benchmarks/benchgit.py "$@"